@@ -0,0 +1,52 @@
+"""Benchmark the overhead of the `after_request` hook on a cache hit.
+
+Run with `python -m benchmarks.after_request`
+"""
+from timeit import repeat
+
+from flask import Flask, Response
+
+from flask_minify import Minify
+
+PAGE = "<html><body>{0}</body></html>".format("<p>lorem ipsum</p>" * 100)
+
+
+def get_app(**options):
+    app = Flask(__name__)
+    ext = Minify(app, go=False, **options)
+
+    @app.route("/")
+    def index():
+        return PAGE
+
+    return app, ext
+
+
+def get_request(app, hook=None):
+    def request():
+        with app.test_request_context("/"):
+            response = Response(PAGE, mimetype="text/html")
+
+            if hook:
+                hook(response)
+
+    return request
+
+
+def main(number=5000):
+    print("{0:>24} {1:>18}".format("options", "overhead (us)"))
+
+    for name, options in (
+        ("defaults", {}),
+        ("bypass", {"bypass": ["other.*"], "bypass_caching": ["another.*"]}),
+    ):
+        app, ext = get_app(**options)
+        get_request(app, ext.main)()  # cache the minified page
+        baseline = min(repeat(get_request(app), number=number, repeat=7))
+        hooked = min(repeat(get_request(app, ext.main), number=number, repeat=7))
+
+        print("{0:>24} {1:>18.2f}".format(name, (hooked - baseline) / number * 1e6))
+
+
+if __name__ == "__main__":
+    main()
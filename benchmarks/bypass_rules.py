@@ -0,0 +1,34 @@
+"""Benchmark checking endpoints against many bypass rules.
+
+Run with `python -m benchmarks.bypass_rules`
+"""
+from timeit import repeat
+
+from flask_minify import Minify
+
+ENDPOINTS = ["blueprint_{0}.view_{0}".format(i) for i in range(100)]
+
+
+def get_rules(count):
+    return [r"^legacy_{0}\.(index|detail)$".format(i) for i in range(count)]
+
+
+def main(number=20):
+    ext = Minify(go=False)
+
+    print("{0:>8} {1:>18}".format("rules", "per check (us)"))
+
+    for count in (10, 100, 1000):
+        ext.bypass = get_rules(count)
+
+        def check():
+            for endpoint in ENDPOINTS:
+                ext.get_endpoint_matches(ext.bypass, endpoint)
+
+        best = min(repeat(check, number=number, repeat=5))
+
+        print("{0:>8} {1:>18.2f}".format(count, best / number / len(ENDPOINTS) * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Benchmark the Go parsers throughput, with many threads sharing them.
+
+Threads alternate between two parsers, with the same or different options.
+
+Run with `python -m benchmarks.go_parsers`
+"""
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+from time import perf_counter
+
+from flask_minify.parsers import Parser, minify_go
+
+OPERATIONS = 20000
+PAGE = "<html>\n  <body>\n<!-- lorem -->\n{0}\n  </body>\n</html>".format(
+    "    <p class='lorem'>  lorem   ipsum  </p>\n" * 20
+)
+SCRIPT = "var  lorem  =  'ipsum';\n" * 20
+
+
+def run(threads, mixed):
+    parsers = [Parser(go=True)]
+    options = {"html": {"html-keep-comments": True}} if mixed else {}
+    parsers.append(Parser(go=True, runtime_options=options))
+    barrier = Barrier(threads + 1)
+    operations = OPERATIONS // threads
+    expected = [
+        {"html": p.minify(PAGE, "html"), "script": p.minify(SCRIPT, "script")}
+        for p in parsers
+    ]
+
+    def work(worker):
+        barrier.wait()
+
+        for i in range(operations):
+            tag, content = ("html", PAGE) if i % 2 else ("script", SCRIPT)
+            which = (worker + i // 2) % 2
+
+            if parsers[which].minify(content, tag) != expected[which][tag]:
+                raise AssertionError("minified with the wrong options")
+
+    with ThreadPoolExecutor(threads) as executor:
+        jobs = [executor.submit(work, worker) for worker in range(threads)]
+        barrier.wait()
+        start = perf_counter()
+
+        for job in jobs:
+            job.result()
+
+        duration = perf_counter() - start
+
+    return operations * threads / duration
+
+
+def main():
+    if not minify_go:
+        print("Go optional dependency is not installed")
+        return
+
+    print(
+        "{0:>8} {1:>22} {2:>22}".format(
+            "threads", "same options ops/sec", "mixed options ops/sec"
+        )
+    )
+
+    for threads in (1, 2, 4, 8, 16):
+        print(
+            "{0:>8} {1:>22,.0f} {2:>22,.0f}".format(
+                threads, run(threads, False), run(threads, True)
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
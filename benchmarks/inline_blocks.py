@@ -0,0 +1,58 @@
+"""Benchmark minifying html pages with many inline script and style blocks.
+
+Run with `python -m benchmarks.inline_blocks`
+"""
+from timeit import repeat
+
+from flask_minify.parsers import Html, Parser
+
+SCRIPT = "<script>\n  var counter{0} = {0};\n  console.log(counter{0});\n</script>"
+STYLE = "<style>\n  .block-{0} {{\n    color: red;\n  }}\n</style>"
+PARAGRAPH = "<p>{0}</p>".format("lorem ipsum dolor sit amet " * 8)
+
+
+def get_page(blocks):
+    body = "\n".join(
+        (SCRIPT if i % 2 else STYLE).format(i) + PARAGRAPH for i in range(blocks)
+    )
+
+    return "<html><body>{0}</body></html>".format(body)
+
+
+def get_parser():
+    parser = Parser({}, go=False)
+    parser.update_runtime_options(html=False, js=True, cssless=True)
+
+    return parser
+
+
+def main():
+    parser = get_parser()
+    parser.parsers = {**parser.parsers, "script": Noop, "style": Noop}
+
+    print("{0:>8} {1:>14} {2:>18}".format("blocks", "page (ms)", "per block (us)"))
+
+    for blocks in (10, 100, 1000):
+        page = get_page(blocks)
+        number = max(1, 1000 // blocks)
+        best = min(repeat(lambda: parser.minify(page, "html"), number=number, repeat=5))
+        per_page = best / number
+
+        print(
+            "{0:>8} {1:>14.3f} {2:>18.3f}".format(
+                blocks, per_page * 1e3, per_page / blocks * 1e6
+            )
+        )
+
+
+class Noop(Html):
+    """Parser only stripping the blocks, to measure rewriting the page."""
+
+    runtime_options = _o = {}
+
+    def executer(self, content, **options):
+        return content.strip()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Benchmark the memory cache throughput, with many threads sharing it.
+
+Run with `python -m benchmarks.memory_cache`
+"""
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier, local
+from time import perf_counter
+
+from flask_minify.cache import MemoryCache
+
+OPERATIONS = 100000
+STORES = 8
+KEYS = 64
+
+
+def get_cache():
+    thread = local()
+    cache = MemoryCache(lambda: thread.store_key, limit=KEYS // 2)
+
+    return cache, thread
+
+
+def run(threads):
+    cache, thread = get_cache()
+    barrier = Barrier(threads + 1)
+    operations = OPERATIONS // threads
+
+    def work(worker):
+        barrier.wait()
+
+        for i in range(operations):
+            thread.store_key = "/{0}".format((worker + i) % STORES)
+            key = "content-{0}".format(i * 7 % KEYS)
+            cache.get_or_set(key, lambda: key)
+
+    with ThreadPoolExecutor(threads) as executor:
+        jobs = [executor.submit(work, worker) for worker in range(threads)]
+        barrier.wait()
+        start = perf_counter()
+
+        for job in jobs:
+            job.result()
+
+        duration = perf_counter() - start
+
+    return operations * threads / duration, cache.stats
+
+
+def main():
+    print("{0:>8} {1:>14} {2:>10}".format("threads", "ops/sec", "hit rate"))
+
+    for threads in (1, 2, 4, 8, 16, 32, 64):
+        throughput, stats = run(threads)
+        hit_rate = stats["hits"] / (stats["hits"] + stats["misses"])
+
+        print("{0:>8} {1:>14,.0f} {2:>10.2%}".format(threads, throughput, hit_rate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Benchmark the overhead `Parser.minify` adds to each minified inline block.
+
+Run with `python -m benchmarks.parser_overhead`
+"""
+from timeit import repeat
+
+from flask_minify.parsers import Jsmin, Parser, Rcssmin
+
+BLOCK = "var a = 1;"
+
+
+class NoopJsmin(Jsmin):
+    @staticmethod
+    def executer(content, **options):
+        return content
+
+
+class NoopRcssmin(Rcssmin):
+    takes_precedence = True
+
+    @staticmethod
+    def executer(content, **options):
+        return content
+
+
+def main(number=100000):
+    parser = Parser({"script": NoopJsmin, "style": NoopRcssmin}, go=False)
+    parser.runtime_options["script"] = {"quote_chars": "'"}
+
+    print("{0:>8} {1:>18}".format("tag", "overhead (us)"))
+
+    for tag, executer in (
+        ("script", NoopJsmin.executer),
+        ("style", NoopRcssmin.executer),
+    ):
+        baseline = min(repeat(lambda: executer(BLOCK), number=number, repeat=7))
+        minify = min(repeat(lambda: parser.minify(BLOCK, tag), number=number, repeat=7))
+
+        print("{0:>8} {1:>18.3f}".format(tag, (minify - baseline) / number * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,219 @@
+import os
+import sqlite3
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager, suppress
+from struct import Struct
+from struct import error as StructError
+from sys import version_info
+from tempfile import gettempdir
+from threading import Lock, local
+from time import monotonic, sleep, time
+from uuid import uuid4
+from weakref import finalize
 
-from flask_minify.utils import get_optimized_hashing
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    from multiprocessing import resource_tracker
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:
+    SharedMemory = None
+
+try:
+    import redis
+except Exception:
+    redis = None
+
+from flask_minify.exceptions import FlaskMinifyException
+from flask_minify.utils import get_optimized_hashing, get_size
+
+
+def check_owner(path, mask=0o002):
+    """Check the file is owned by the current user, and not writable by others,
+    before loading the cached entries it holds.
+
+    Parameters
+    ----------
+    path: str or int
+        path of the file or directory, not followed if it's a link, or its
+        file descriptor.
+    mask: int
+        permission bits the other users must not have.
+
+    Raises
+    ------
+    FlaskMinifyException
+        if the file is owned by another user, or accessible to other users.
+    """
+    if not hasattr(os, "getuid"):
+        return
+
+    stat = os.fstat(path) if isinstance(path, int) else os.lstat(path)
+
+    if stat.st_uid != os.getuid() or stat.st_mode & mask:
+        raise FlaskMinifyException(
+            'Cannot use "{0}", it must be owned by the current user, and not '
+            "accessible to others".format(path)
+        )
+
+
+def get_private_dir():
+    """Get the temporary directory private to the current user, to keep the
+    caches files in, where other users can't plant them.
+
+    Returns
+    -------
+    str
+        path of the directory, created if missing.
+    """
+    uid = "-{0}".format(os.getuid()) if hasattr(os, "getuid") else ""
+    path = os.path.join(gettempdir(), "flask_minify{0}".format(uid))
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    # a link to another directory has all the permission bits set
+    check_owner(path, mask=0o077)
+
+    return path
+
+
+class MinifiedContent(str):
+    """Minified content, cached with its pre-computed variants.
+
+    Attributes
+    ----------
+        encodings: dict
+            content encodings and the compressed content bytes.
+        etag: str
+            digest of the minified content.
+    """
+
+    encodings = {}
+    etag = None
+
+
+# number of compressed variants, ETag length
+MINIFIED_VARIANTS = Struct("<BH")
+# content encoding length, compressed content length
+MINIFIED_VARIANT = Struct("<BQ")
+
+
+def encode_minified(value):
+    """Encode the minified content, with its compressed variants and ETag,
+    to store it out of the process without pickling it.
+
+    Parameters
+    ----------
+    value: str
+        minified content to encode.
+
+    Returns
+    -------
+    bytes
+        encoded content.
+    """
+    encodings = getattr(value, "encodings", {})
+    etag = (getattr(value, "etag", None) or "").encode("utf-8")
+    data = [MINIFIED_VARIANTS.pack(len(encodings), len(etag)), etag]
+
+    for encoding, compressed in encodings.items():
+        encoding = encoding.encode("utf-8")
+        data += [MINIFIED_VARIANT.pack(len(encoding), len(compressed)), encoding]
+        data.append(compressed)
+
+    data.append(value.encode("utf-8"))
+
+    return b"".join(data)
+
+
+def decode_minified(data):
+    """Decode the minified content, with its compressed variants and ETag.
+
+    Parameters
+    ----------
+    data: bytes
+        encoded content.
+
+    Returns
+    -------
+    str
+        minified content, a `MinifiedContent` if it has variants or an ETag,
+        or None if the data is malformed.
+    """
+    try:
+        count, etag_length = MINIFIED_VARIANTS.unpack_from(data)
+        offset = MINIFIED_VARIANTS.size + etag_length
+        etag = data[MINIFIED_VARIANTS.size : offset].decode("utf-8")
+        encodings = {}
+
+        for _ in range(count):
+            encoding_length, length = MINIFIED_VARIANT.unpack_from(data, offset)
+            offset += MINIFIED_VARIANT.size + encoding_length
+            encoding = data[offset - encoding_length : offset].decode("utf-8")
+            encodings[encoding] = data[offset : offset + length]
+            offset += length
+
+        content = str(data[offset:], "utf-8")
+    except (StructError, ValueError):
+        return None
+
+    if not (encodings or etag):
+        return content
+
+    value = MinifiedContent(content)
+    value.encodings = encodings
+    value.etag = etag or None
+
+    return value
+
+
+class SingleFlight:
+    """Lets only one of the threads missing the same key compute its value,
+    while the others wait for it."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._flights = {}
+
+    def __getstate__(self):
+        # the flights are bound to the current process threads
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    def do(self, key, getter):
+        with self._lock:
+            flight = self._flights.get(key)
+            leading = flight is None
+
+            if leading:
+                flight = self._flights[key] = Future()
+
+        if leading:
+            try:
+                flight.set_result(getter())
+            except BaseException as e:
+                flight.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._flights[key]
+
+        return flight.result()
 
 
 class CacheBase(metaclass=ABCMeta):
+    # seconds to wait for another process computing the same entry
+    lock_timeout = 5
+    lock_poll_interval = 0.02
+
     def __init__(self, store_key_getter=None):
         self.store_key_getter = store_key_getter
+        self.hashing = get_optimized_hashing()
+        self.flights = SingleFlight()
 
     @abstractmethod
     def __getitem__(self, key):
@@ -16,52 +224,1062 @@ class CacheBase(metaclass=ABCMeta):
         pass
 
     @abstractmethod
-    def get_or_set(self, key, getter):
+    def clear(self):
         pass
 
-    @abstractmethod
-    def clear(self):
+    def __delitem__(self, key):
+        """Drop an outdated entry, backends without support leave it to eviction."""
         pass
 
+    def hash_key(self, key):
+        return self.hashing(key.encode("utf-8")).hexdigest()
+
+    def acquire(self, key):
+        """Lock the entry for computing it, backends shared between processes
+        override it, so only one of the processes computes it.
+
+        Returns
+        -------
+        bool
+            True if locked, False if another process is computing the entry.
+        """
+        return True
+
+    def release(self, key):
+        pass
+
+    def is_locked(self, key):
+        return False
+
+    def wait(self, key):
+        """Wait for another process computing the entry, up to `lock_timeout`."""
+        deadline = monotonic() + self.lock_timeout
+
+        while monotonic() < deadline:
+            sleep(self.lock_poll_interval)
+            value = self[key]
+
+            if value is not None or not self.is_locked(key):
+                return value
+
+        return None
+
+    def compute(self, key, getter):
+        locked = self.acquire(key)
+
+        if not locked:
+            value = self.wait(key)
+
+            if value is not None:
+                return value
+
+        try:
+            value = getter()
+            self[key] = value
+        finally:
+            if locked:
+                self.release(key)
+
+        return value
+
+    def get_or_set(self, key, getter):
+        hashed_key = self.hash_key(key)
+        value = self[hashed_key]
+
+        if value is None:
+            value = self.flights.do(
+                hashed_key, lambda: self.compute(hashed_key, getter)
+            )
+
+        return value
+
+
+class StoreMixin:
+    """Keeps track of the approximate size of a store's entries in bytes."""
+
+    def __init__(self):
+        super().__init__()
+        self.size = 0
+
+    def __setitem__(self, key, value):
+        if key in self:
+            self.size -= get_size(key, self[key])
+
+        super().__setitem__(key, value)
+        self.size += get_size(key, value)
+
+    def __delitem__(self, key):
+        self.size -= get_size(key, self[key])
+        super().__delitem__(key)
+
+
+class LRUStore(StoreMixin, OrderedDict):
+    """Store evicting the least recently used entry first."""
+
+    def hit(self, key):
+        self.move_to_end(key)
+
+    @property
+    def victim(self):
+        return next(iter(self))
+
+
+class LFUStore(StoreMixin, dict):
+    """Store evicting the least frequently used entry first, oldest on ties."""
+
+    def __init__(self):
+        super().__init__()
+        self.frequencies = {}
+        self.buckets = {}
+        self.min_frequency = 0
+
+    def __setitem__(self, key, value):
+        if key in self:
+            self.hit(key)
+        else:
+            self.frequencies[key] = 1
+            self.buckets.setdefault(1, OrderedDict())[key] = None
+            self.min_frequency = 1
+
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.discard_from_bucket(key, self.frequencies.pop(key))
+
+    def discard_from_bucket(self, key, frequency):
+        bucket = self.buckets[frequency]
+        del bucket[key]
+
+        if not bucket:
+            del self.buckets[frequency]
+
+    def hit(self, key):
+        frequency = self.frequencies[key]
+        self.discard_from_bucket(key, frequency)
+
+        if self.min_frequency == frequency and frequency not in self.buckets:
+            self.min_frequency += 1
+
+        self.frequencies[key] = frequency + 1
+        self.buckets.setdefault(frequency + 1, OrderedDict())[key] = None
+
+    @property
+    def victim(self):
+        if self.min_frequency not in self.buckets:
+            self.min_frequency = min(self.buckets)
+
+        return next(iter(self.buckets[self.min_frequency]))
+
+
+class ThreadCellOwner:
+    """Kept in a thread local data, so it's released once the thread exits."""
+
+
+class ThreadsCounter:
+    """Counter incremented by many threads without locking, each of them
+    counting in a cell of its own, folded into the total once it exits."""
+
+    def __init__(self, value=0):
+        self._local = local()
+        self._lock = Lock()
+        self._total = value
+        self._cells = {}
+
+    def __getstate__(self):
+        # the cells are bound to the current process threads
+        return {"value": self.value}
+
+    def __setstate__(self, state):
+        self.__init__(state["value"])
+
+    @property
+    def value(self):
+        with self._lock:
+            return self._total + sum(cell[0] for cell in self._cells.values())
+
+    def add_cell(self):
+        cell = self._local.cell = [0]
+        self._local.owner = ThreadCellOwner()
+
+        with self._lock:
+            self._cells[id(cell)] = cell
+
+        finalize(self._local.owner, self.fold_cell, cell)
+
+        return cell
+
+    def fold_cell(self, cell):
+        with self._lock:
+            del self._cells[id(cell)]
+            self._total += cell[0]
+
+    def increment(self):
+        cell = getattr(self._local, "cell", None) or self.add_cell()
+        cell[0] += 1
+
 
 class MemoryCache(CacheBase):
-    def __init__(self, store_key_getter=None, limit=0):
+    """Cache in the process memory, safe to share between threads.
+
+    Writes are serialized by a lock, while lookups never wait for it: when
+    it's busy, they skip tracking the entries and stores recency.
+    """
+
+    policies = {"lru": LRUStore, "lfu": LFUStore}
+
+    def __init__(
+        self,
+        store_key_getter=None,
+        limit=0,
+        size_limit=0,
+        policy="lru",
+        store_limit=0,
+        store_ttl=0,
+        memory_limit=0,
+    ):
         super().__init__(store_key_getter)
+
+        if policy not in self.policies:
+            raise FlaskMinifyException('Unknown caching policy "{0}"'.format(policy))
+
         self.limit = limit
-        self.hashing = get_optimized_hashing()
-        self._cache = {}
+        self.size_limit = size_limit
+        self.policy = policy
+        self.store_limit = store_limit
+        self.store_ttl = store_ttl
+        self.memory_limit = memory_limit
+        self.evictions = 0
+        self.size = 0
+        self._hits = ThreadsCounter()
+        self._misses = ThreadsCounter()
+        self._lock = Lock()
+        self._cache = OrderedDict()
+        self._accessed = {}
+
+    def __getstate__(self):
+        # locks are bound to the current process
+        return {k: v for k, v in self.__dict__.items() if k != "_lock"}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _lock=Lock())
+
+    @property
+    def hits(self):
+        return self._hits.value
+
+    @property
+    def misses(self):
+        return self._misses.value
 
     @property
     def store(self):
-        if self.store_key_getter:
-            return self._cache.setdefault(self.store_key_getter(), {})
+        return self.get_store(self.get_store_key())
+
+    def get_store_key(self):
+        return self.store_key_getter() if self.store_key_getter else None
+
+    def get_store(self, store_key, create=True):
+        """Get the store of the key, dropping the idle and least recently used
+        stores if needed, must be called holding the lock."""
+        now = monotonic() if self.store_ttl else 0
+
+        if self.store_ttl:
+            self.evict_idle_stores(now - self.store_ttl)
+
+        store = self._cache.get(store_key)
+
+        if store is None:
+            if not create:
+                return None
+
+            while self.store_limit and len(self._cache) >= self.store_limit:
+                self.evict_store(next(iter(self._cache)))
+
+            store = self._cache[store_key] = self.policies[self.policy]()
+        else:
+            self._cache.move_to_end(store_key)
 
-        return self._cache
+        if self.store_ttl:
+            self._accessed[store_key] = now
+
+        return store
 
     @property
-    def limit_exceeded(self):
-        return len(self.store) >= self.limit
+    def stats(self):
+        """Counters to monitor the cache effectiveness with."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "stores": len(self._cache),
+                "entries": sum(len(s) for s in self._cache.values()),
+                "size": self.size,
+            }
+
+    def exceeds_limits(self, store, size):
+        return (self.limit and len(store) >= self.limit) or (
+            self.size_limit and store.size + size > self.size_limit
+        )
+
+    def evict_store(self, store_key):
+        """Drop the whole store of an endpoint with all its entries."""
+        store = self._cache.pop(store_key)
+        self._accessed.pop(store_key, None)
+        self.size -= store.size
+        self.evictions += len(store)
+
+    def evict_idle_stores(self, deadline):
+        """Drop the stores that were not accessed since the deadline."""
+        while self._cache:
+            store_key = next(iter(self._cache))
+
+            if self._accessed.get(store_key, deadline) > deadline:
+                break
+
+            self.evict_store(store_key)
+
+    def delete(self, store, key):
+        size = store.size
+        del store[key]
+        self.size -= size - store.size
 
     def __getitem__(self, key):
-        return self.store.get(key)
+        store_key = self.get_store_key()
+
+        if not self._lock.acquire(blocking=False):
+            store = self._cache.get(store_key)
+
+            return None if store is None else store.get(key)
+
+        try:
+            store = self.get_store(store_key, create=False)
+            value = None if store is None else store.get(key)
+
+            if value is not None:
+                store.hit(key)
+
+            return value
+        finally:
+            self._lock.release()
+
+    def __delitem__(self, key):
+        store_key = self.get_store_key()
+
+        with self._lock:
+            store = self.get_store(store_key, create=False)
+
+            if store is not None and key in store:
+                self.delete(store, key)
 
     def __setitem__(self, key, value):
-        if self.limit_exceeded:
-            self.store.popitem()
+        store_key = self.get_store_key()
+        size = get_size(key, value)
+        too_big = (self.size_limit and size > self.size_limit) or (
+            self.memory_limit and size > self.memory_limit
+        )
+
+        if too_big:
+            return
+
+        with self._lock:
+            store = self.get_store(store_key)
+
+            if key in store:
+                self.delete(store, key)
+
+            while store and self.exceeds_limits(store, size):
+                self.delete(store, store.victim)
+                self.evictions += 1
+
+            while self.memory_limit and self.size + size > self.memory_limit:
+                lru_store_key, lru_store = next(iter(self._cache.items()))
 
-        self.store.update({key: value})
+                if lru_store is store:
+                    self.delete(store, store.victim)
+                    self.evictions += 1
+                else:
+                    self.evict_store(lru_store_key)
+
+            store[key] = value
+            self.size += size
 
     def get_or_set(self, key, getter):
         if self.limit == 0:
             return getter()
 
-        hashed_key = self.hashing(key.encode("utf-8")).hexdigest()
+        hashed_key = self.hash_key(key)
+        value = self[hashed_key]
+
+        if value is None:
+            self._misses.increment()
+            value = self.flights.do(
+                hashed_key, lambda: self.compute(hashed_key, getter)
+            )
+        else:
+            self._hits.increment()
+
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._cache = OrderedDict()
+            self._accessed = {}
+            self.size = 0
+
+
+class TieredCache(CacheBase):
+    """Cache composed of multiple caches, ordered from the fastest to the slowest.
+
+    Lookups go through the tiers in order, and a hit is promoted to the faster
+    tiers that missed it. writes go to all tiers.
+
+    Parameters
+    ----------
+        tiers: CacheBase
+            caches to compose, such as a small `MemoryCache` and a shared one.
+            memory tiers must set `limit` or `memory_limit`, since they'd grow
+            without bounds otherwise.
+    """
+
+    def __init__(self, *tiers, store_key_getter=None):
+        for tier in tiers:
+            if isinstance(tier, MemoryCache) and not (tier.limit or tier.memory_limit):
+                raise FlaskMinifyException(
+                    "Cannot use a `MemoryCache` tier without a `limit` or a "
+                    "`memory_limit`"
+                )
 
-        if not self[hashed_key]:
-            self[hashed_key] = getter()
+        self.tiers = tiers
+        super().__init__(store_key_getter)
+
+    @property
+    def store_key_getter(self):
+        return self._store_key_getter
+
+    @store_key_getter.setter
+    def store_key_getter(self, getter):
+        self._store_key_getter = getter
+
+        for tier in self.tiers:
+            if not tier.store_key_getter:
+                tier.store_key_getter = getter
+
+    def __getitem__(self, key):
+        for index, tier in enumerate(self.tiers):
+            value = tier[key]
+
+            if value is not None:
+                for faster_tier in self.tiers[:index]:
+                    faster_tier[key] = value
+
+                return value
+
+        return None
+
+    def __setitem__(self, key, value):
+        for tier in self.tiers:
+            tier[key] = value
+
+    def __delitem__(self, key):
+        for tier in self.tiers:
+            del tier[key]
+
+    def acquire(self, key):
+        return self.tiers[-1].acquire(key)
+
+    def release(self, key):
+        self.tiers[-1].release(key)
+
+    def is_locked(self, key):
+        return self.tiers[-1].is_locked(key)
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+
+class RedisCache(CacheBase):
+    """Cache shared by all the processes connected to the same Redis server.
+
+    Parameters
+    ----------
+        client: redis.Redis
+            client instance to use instead of connecting to `url`.
+        url: str
+            Redis server URL to connect to.
+        prefix: str
+            prefix of the cached entries keys.
+        timeout: int
+            seconds before a cached entry expires, 0 to never expire.
+    """
+
+    # deletes the lock only if it still holds the token of its holder
+    release_script = (
+        'if redis.call("get", KEYS[1]) == ARGV[1] then '
+        'return redis.call("del", KEYS[1]) else return 0 end'
+    )
+
+    def __init__(
+        self,
+        client=None,
+        url="redis://localhost:6379/0",
+        prefix="flask_minify:",
+        timeout=0,
+    ):
+        super().__init__()
+
+        if client is None:
+            if not redis:
+                raise FlaskMinifyException(
+                    "Cannot use Redis cache without installing "
+                    "Redis optional dependency: `pip install flask-minify[redis]`"
+                )
+
+            client = redis.Redis.from_url(url)
+
+        self.client = client
+        self.prefix = prefix
+        self.timeout = timeout
+        self._tokens = {}
+
+    def __getitem__(self, key):
+        value = self.client.get(self.prefix + key)
+
+        return None if value is None else decode_minified(value)
+
+    def __setitem__(self, key, value):
+        if not isinstance(value, str):
+            return
+
+        self.client.set(
+            self.prefix + key,
+            encode_minified(value),
+            ex=self.timeout or None,
+        )
+
+    def __delitem__(self, key):
+        self.client.delete(self.prefix + key)
+
+    def get_lock_key(self, key):
+        return "{0}lock:{1}".format(self.prefix, key)
+
+    def acquire(self, key):
+        lock_timeout = int(self.lock_timeout * 1000)
+        token = uuid4().hex
+
+        if not self.client.set(self.get_lock_key(key), token, nx=True, px=lock_timeout):
+            return False
+
+        self._tokens[key] = token
+
+        return True
+
+    def release(self, key):
+        token = self._tokens.pop(key, None)
+
+        if token is not None:
+            # not a lock taken by another process, once this one expired
+            self.client.eval(self.release_script, 1, self.get_lock_key(key), token)
+
+    def is_locked(self, key):
+        return bool(self.client.exists(self.get_lock_key(key)))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+
+        if keys:
+            self.client.delete(*keys)
+
+
+class DiskCache(CacheBase):
+    """Cache persisted to a SQLite database, shared by the processes using it.
+
+    Parameters
+    ----------
+        path: str
+            path of the SQLite database file, defaults to one in a temporary
+            directory private to the current user.
+        size_limit: int
+            limit the size of the cached entries in bytes, 0 for no limit.
+        timeout: int
+            seconds to wait for another process to release the database lock,
+            before treating the lookup as a miss, or skipping the write.
+    """
+
+    schema = (
+        "CREATE TABLE IF NOT EXISTS entries ("
+        "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+        "size INTEGER NOT NULL, accessed REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)",
+        "CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY, size INTEGER)",
+        "INSERT OR IGNORE INTO usage VALUES (0, 0)",
+        "CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries "
+        "BEGIN UPDATE usage SET size = size + NEW.size; END",
+        "CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries "
+        "BEGIN UPDATE usage SET size = size + NEW.size - OLD.size; END",
+        "CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries "
+        "BEGIN UPDATE usage SET size = size - OLD.size; END",
+        "CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, expires REAL NOT NULL)",
+    )
+    # seconds before a hit refreshes the entry's access time, to spare writes
+    touch_interval = 60
+    # process ids and paths of the databases whose schema was created
+    _schemas = set()
+    _schemas_lock = Lock()
+
+    def __init__(self, path=None, size_limit=64 * 1024 * 1024, timeout=5):
+        super().__init__()
+        self.path = path or os.path.join(get_private_dir(), "cache.sqlite")
+        self.size_limit = size_limit
+        self.timeout = timeout
+        self._local = local()
+
+    @property
+    def connection(self):
+        """SQLite connection of the current thread, renewed after forking."""
+        pid = os.getpid()
+
+        if getattr(self._local, "pid", None) != pid:
+            exists = os.path.exists(self.path)
+
+            if exists:
+                check_owner(self.path)
+
+            connection = sqlite3.connect(
+                self.path,
+                timeout=self.timeout,
+                isolation_level=None,
+            )
+            connection.execute("PRAGMA synchronous=NORMAL")
+
+            if not exists or (pid, self.path) not in self._schemas:
+                self.create_schema(connection, pid, force=not exists)
+
+            self._local.connection = connection
+            self._local.locks = {}
+            self._local.pid = pid
+
+        return self._local.connection
+
+    def create_schema(self, connection, pid, force=False):
+        """Create the database tables once per process, or once the database
+        is missing, since it takes the database write lock."""
+        with self._schemas_lock:
+            if not force and (pid, self.path) in self._schemas:
+                return
+
+            connection.execute("PRAGMA journal_mode=WAL")
+
+            with self.transaction(connection):
+                for statement in self.schema:
+                    connection.execute(statement)
+
+            self._schemas.add((pid, self.path))
+
+    @staticmethod
+    @contextmanager
+    def transaction(connection):
+        connection.execute("BEGIN IMMEDIATE")
+
+        try:
+            yield connection
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        connection.execute("COMMIT")
+
+    @property
+    def size(self):
+        return self.connection.execute("SELECT size FROM usage").fetchone()[0]
+
+    def __getitem__(self, key):
+        now = time()
+
+        # a database locked for longer than `timeout` is a miss
+        try:
+            row = self.connection.execute(
+                "SELECT value, accessed FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            value, accessed = row
+
+            if now - accessed > self.touch_interval:
+                self.connection.execute(
+                    "UPDATE entries SET accessed = ? WHERE key = ?", (now, key)
+                )
+        except sqlite3.OperationalError:
+            return None
+
+        return decode_minified(value)
+
+    def __setitem__(self, key, value):
+        if not isinstance(value, str):
+            return
+
+        data = encode_minified(value)
+
+        if self.size_limit and len(data) > self.size_limit:
+            return
+
+        # a database locked for longer than `timeout` skips the write
+        with suppress(sqlite3.OperationalError):
+            with self.transaction(self.connection) as connection:
+                connection.execute(
+                    "INSERT INTO entries VALUES (?, ?, ?, ?) ON CONFLICT (key) "
+                    "DO UPDATE SET value = excluded.value, size = excluded.size, "
+                    "accessed = excluded.accessed",
+                    (key, data, len(data), time()),
+                )
+
+                while self.size_limit and self.size > self.size_limit:
+                    connection.execute(
+                        "DELETE FROM entries WHERE key = "
+                        "(SELECT key FROM entries ORDER BY accessed LIMIT 1)"
+                    )
+
+    def __delitem__(self, key):
+        with suppress(sqlite3.OperationalError):
+            with self.transaction(self.connection) as connection:
+                connection.execute("DELETE FROM entries WHERE key = ?", (key,))
 
-        return self[hashed_key]
+    def acquire(self, key):
+        now = time()
+        expires = now + self.lock_timeout
+
+        try:
+            with self.transaction(self.connection) as connection:
+                connection.execute(
+                    "DELETE FROM locks WHERE key = ? AND expires < ?", (key, now)
+                )
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO locks VALUES (?, ?)", (key, expires)
+                )
+        except sqlite3.OperationalError:
+            # the database is busy, so the entry is computed without the lock
+            return True
+
+        if cursor.rowcount != 1:
+            return False
+
+        self._local.locks[key] = expires
+
+        return True
+
+    def release(self, key):
+        expires = getattr(self._local, "locks", {}).pop(key, None)
+
+        if expires is None:
+            return
+
+        # only the lock taken by `acquire`, not one taken after it expired
+        with suppress(sqlite3.OperationalError):
+            with self.transaction(self.connection) as connection:
+                connection.execute(
+                    "DELETE FROM locks WHERE key = ? AND expires = ?", (key, expires)
+                )
+
+    def is_locked(self, key):
+        try:
+            return bool(
+                self.connection.execute(
+                    "SELECT 1 FROM locks WHERE key = ? AND expires >= ?",
+                    (key, time()),
+                ).fetchone()
+            )
+        except sqlite3.OperationalError:
+            return False
+
+    def clear(self):
+        with self.transaction(self.connection) as connection:
+            connection.execute("DELETE FROM entries")
+
+
+class SharedMemoryCache(CacheBase):
+    """Cache in a shared memory arena, shared by the processes on the same host.
+
+    The arena holds an open-addressed index of the entries digests, followed by
+    a ring buffer of their data. once the ring buffer is full, writing wraps to
+    its start and the entries it overwrites are no longer valid.
+
+    Lookups don't take any lock: each slot holds the checksum of its data, so
+    data overwritten while it's being read is a miss. the entries are stored as
+    utf-8 text, preceded by their compressed variants and ETag if any.
+
+    Parameters
+    ----------
+        name: str
+            name of the shared memory block, processes using the same name share
+            it, it must be owned by the current user.
+        size: int
+            size of the ring buffer holding the cached entries in bytes.
+        slots: int
+            maximum number of cached entries.
+
+    Notes
+    -----
+    the shared memory block outlives the processes using it, until `unlink` is called.
+    on platforms without `fcntl` (Windows) access is only synchronized between threads.
+    """
+
+    magic = b"flaskmi2"
+    # magic, number of slots, data size, write offset, lap of the ring buffer
+    header = Struct("<8sQQQQ")
+    # digest, lap, offset, length, checksum
+    slot = Struct("<QQQQQ")
+    max_probes = 8
+    max_lock_offset = 2**31 - 1
+
+    def __init__(self, name, size=64 * 1024 * 1024, slots=16384):
+        super().__init__()
+
+        if SharedMemory is None:
+            raise FlaskMinifyException(
+                "Cannot use shared memory cache without `multiprocessing.shared_memory`"
+            )
+
+        self.name = name
+        self._pid = None
+        self.memory = self.open_memory(
+            name, self.header.size + self.slot.size * slots + size
+        )
+
+        with self.locked():
+            magic, *_ = self.header.unpack_from(self.memory.buf)
+
+            if magic != self.magic:
+                self.header.pack_into(self.memory.buf, 0, self.magic, slots, size, 0, 0)
+
+        _, self.slots, self.data_size, *_ = self.header.unpack_from(self.memory.buf)
+        self.data_start = self.header.size + self.slot.size * self.slots
+
+    @staticmethod
+    def open_memory(name, size):
+        untracked = {"track": False} if version_info >= (3, 13) else {}
+
+        try:
+            memory = SharedMemory(name, create=True, size=size, **untracked)
+        except FileExistsError:
+            memory = SharedMemory(name, **untracked)
+
+        if not untracked and os.name == "posix":
+            # the block is shared between processes, so it must not be
+            # unlinked when the first of them exits
+            resource_tracker.unregister(memory._name, "shared_memory")
+
+        if os.name == "posix":
+            try:
+                check_owner(memory._fd, mask=0o077)
+            except FlaskMinifyException:
+                memory.close()
+                raise FlaskMinifyException(
+                    'Cannot use shared memory block "{0}", it must be owned by '
+                    "the current user, and not accessible to others".format(name)
+                ) from None
+
+        return memory
+
+    @property
+    def lock_path(self):
+        return os.path.join(get_private_dir(), "{0}.lock".format(self.name))
+
+    @property
+    def keys_lock_path(self):
+        return os.path.join(get_private_dir(), "{0}.keys.lock".format(self.name))
+
+    def reset_locks(self):
+        """Renew the locks in new processes, since forked ones share the lock file."""
+        self._pid = os.getpid()
+        self._lock = Lock()
+        self._lock_file = open(self.lock_path, "a+") if fcntl else None
+        self._keys_lock_file = open(self.keys_lock_path, "a+") if fcntl else None
+
+    def lock_key(self, key, operation):
+        """Lock or unlock the byte of the keys lock file at the key digest offset.
+
+        The locks are held per process, and released if the process dies.
+
+        Returns
+        -------
+        bool
+            True if done, False if another process holds the lock.
+        """
+        if self._pid != os.getpid():
+            self.reset_locks()
+
+        offset = self.get_digest(key) % self.max_lock_offset
+
+        try:
+            fcntl.lockf(self._keys_lock_file, operation, 1, offset)
+        except OSError:
+            return False
+
+        return True
+
+    def acquire(self, key):
+        return self.lock_key(key, fcntl.LOCK_EX | fcntl.LOCK_NB) if fcntl else True
+
+    def release(self, key):
+        if fcntl:
+            self.lock_key(key, fcntl.LOCK_UN)
+
+    def is_locked(self, key):
+        if not self.acquire(key):
+            return True
+
+        self.release(key)
+
+        return False
+
+    @contextmanager
+    def locked(self):
+        """Lock the arena for writing, lookups don't need it."""
+        if self._pid != os.getpid():
+            self.reset_locks()
+
+        with self._lock:
+            if self._lock_file:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+
+            try:
+                yield
+            finally:
+                if self._lock_file:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def get_digest(self, key):
+        # zero marks an empty slot
+        return int(key, 16) or 1
+
+    def get_slot_offset(self, index):
+        return self.header.size + self.slot.size * index
+
+    def get_probes(self, digest):
+        start = digest % self.slots
+
+        return (
+            self.get_slot_offset((start + i) % self.slots)
+            for i in range(min(self.max_probes, self.slots))
+        )
+
+    def is_valid(self, lap, offset):
+        *_, write_offset, current_lap = self.header.unpack_from(self.memory.buf)
+
+        return lap == current_lap or (lap + 1 == current_lap and offset >= write_offset)
+
+    def __getitem__(self, key):
+        digest = self.get_digest(key)
+        buf = self.memory.buf
+
+        for slot_offset in self.get_probes(digest):
+            slot_digest, lap, offset, length, checksum = self.slot.unpack_from(
+                buf, slot_offset
+            )
+
+            if slot_digest == 0:
+                break
+
+            if slot_digest != digest or not self.is_valid(lap, offset):
+                continue
+
+            if offset + length > self.data_size:
+                return None
+
+            start = self.data_start + offset
+            # copied before checking, since it may be overwritten meanwhile
+            data = bytes(buf[start : start + length])
+
+            if self.hashing(data).intdigest() != checksum:
+                return None
+
+            return decode_minified(data)
+
+        return None
+
+    def __setitem__(self, key, value):
+        if not isinstance(value, str):
+            return
+
+        digest = self.get_digest(key)
+        data = encode_minified(value)
+        checksum = self.hashing(data).intdigest()
+
+        if len(data) > self.data_size:
+            return
+
+        with self.locked():
+            buf = self.memory.buf
+            magic, slots, data_size, write_offset, lap = self.header.unpack_from(buf)
+
+            if write_offset + len(data) > data_size:
+                write_offset = 0
+                lap += 1
+
+            start = self.data_start + write_offset
+            buf[start : start + len(data)] = data
+            self.header.pack_into(
+                buf, 0, magic, slots, data_size, write_offset + len(data), lap
+            )
+            self.slot.pack_into(
+                buf,
+                self.find_slot(digest),
+                digest,
+                lap,
+                write_offset,
+                len(data),
+                checksum,
+            )
+
+    def find_slot(self, digest):
+        """Find the slot of the digest, or a free one, or else the one to evict."""
+        free_slot = None
+
+        for slot_offset in self.get_probes(digest):
+            slot_digest, lap, offset, *_ = self.slot.unpack_from(
+                self.memory.buf, slot_offset
+            )
+
+            if slot_digest == digest:
+                return slot_offset
+
+            if free_slot is None and (
+                slot_digest == 0 or not self.is_valid(lap, offset)
+            ):
+                free_slot = slot_offset
+
+        return (
+            self.get_slot_offset(digest % self.slots)
+            if free_slot is None
+            else free_slot
+        )
 
     def clear(self):
-        del self._cache
-        self._cache = {}
+        with self.locked():
+            magic, slots, data_size, _, lap = self.header.unpack_from(self.memory.buf)
+            # skipping a lap invalidates all the entries of the previous one
+            self.header.pack_into(
+                self.memory.buf, 0, magic, slots, data_size, 0, lap + 2
+            )
+
+    def close(self):
+        self.memory.close()
+
+        if self._lock_file:
+            self._lock_file.close()
+            self._keys_lock_file.close()
+
+    def unlink(self):
+        if version_info < (3, 13) and os.name == "posix":
+            # unlinking unregisters the block, which was done on opening it
+            resource_tracker.register(self.memory._name, "shared_memory")
+
+        self.memory.unlink()
+
+        for path in (self.lock_path, self.keys_lock_path):
+            if fcntl and os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,89 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from flask_minify.utils import get_static_folders
+
+
+def get_minified_path(path):
+    root, extension = os.path.splitext(path)
+
+    return "{0}.min{1}".format(root, extension)
+
+
+def minify_file(parser, source, destination, tag):
+    with open(source, encoding="utf-8") as f:
+        content = f.read()
+
+    with open(destination, "w", encoding="utf-8") as f:
+        f.write(parser.minify(content, tag))
+
+
+def get_static_files(ext, endpoint, folder):
+    """Get the static files of the folder which the extension should minify.
+
+    Returns
+    -------
+        Generator of files relative paths and the tags to minify them as.
+    """
+    url_path = current_app.static_url_path if endpoint == "static" else None
+
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            filename = os.path.relpath(os.path.join(root, name), folder)
+            filename = filename.replace(os.sep, "/")
+            tag = ext.get_static_tag(filename)
+            # static files bypassing matches their path, like at runtime
+            path = "{0}/{1}".format(url_path, filename) if url_path else endpoint
+            _, bypassed = ext.get_endpoint_matches(ext.bypass, path)
+
+            if tag and not bypassed and ".min." not in name:
+                yield filename, tag
+
+
+@click.group()
+def minify():
+    """Flask-Minify commands."""
+
+
+@minify.command()
+@click.option(
+    "--workers",
+    "-w",
+    type=int,
+    default=None,
+    help="Number of processes to minify with, defaults to the number of CPUs.",
+)
+@with_appcontext
+def build(workers):
+    """Minify the static files ahead of time, to serve them as they are."""
+    ext = current_app.extensions["minify"]
+
+    with ProcessPoolExecutor(workers) as executor:
+        for endpoint, folder in get_static_folders(current_app).items():
+            manifest = {}
+            jobs = []
+
+            for filename, tag in get_static_files(ext, endpoint, folder):
+                manifest[filename] = get_minified_path(filename)
+                jobs.append(
+                    executor.submit(
+                        minify_file,
+                        ext.parser,
+                        os.path.join(folder, filename),
+                        os.path.join(folder, manifest[filename]),
+                        tag,
+                    )
+                )
+
+            for job in jobs:
+                job.result()
+
+            with open(os.path.join(folder, ext.manifest_name), "w") as f:
+                json.dump(manifest, f, indent=2, sort_keys=True)
+
+            click.echo("Minified {0} files of {1}".format(len(manifest), folder))
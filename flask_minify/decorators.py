@@ -1,6 +1,6 @@
 from functools import wraps
 
-from flask_minify.cache import MemoryCache
+from flask_minify.cache import MemoryCache, TieredCache
 from flask_minify.parsers import Parser
 
 
@@ -10,6 +10,10 @@ def minify(
     cssless=False,
     cache=True,
     caching_limit=2,
+    caching_size_limit=0,
+    caching_policy="lru",
+    caching_inline_limit=100,
+    cache_backend=None,
     fail_safe=True,
     parsers={},
     go=True,
@@ -28,6 +32,16 @@ def minify(
             enable caching minifed response.
         caching_limit: int
             to limit the number of minified response variations.
+        caching_size_limit: int
+            to limit the size of minified response variations in bytes.
+        caching_policy: str
+            cache eviction policy, either "lru" or "lfu".
+        caching_inline_limit: int
+            to limit the number of minified inline script and style blocks
+            cached by their content.
+        cache_backend: CacheBase or list
+            cache instance to use instead of the default `MemoryCache`, or
+            list of caches to compose into a `TieredCache`.
         failsafe: bool
             silence encountered exceptions.
         parsers: dict
@@ -39,8 +53,20 @@ def minify(
     -------
         String of minified HTML content.
     """
-    caching = MemoryCache(limit=caching_limit if cache else 0)
-    parser = Parser(parsers, fail_safe, go=go)
+    if isinstance(cache_backend, (list, tuple)):
+        cache_backend = TieredCache(*cache_backend)
+
+    caching = (cache and cache_backend) or MemoryCache(
+        limit=caching_limit if cache else 0,
+        size_limit=caching_size_limit,
+        policy=caching_policy,
+    )
+    parser = Parser(
+        parsers,
+        fail_safe,
+        go=go,
+        inline_caching_limit=caching_inline_limit if cache else 0,
+    )
     parser.update_runtime_options(html, js, cssless)
 
     def decorator(function):
@@ -53,7 +79,9 @@ def minify(
             if not should_minify:
                 return content
 
-            return caching.get_or_set(content, get_minified)
+            return caching.get_or_set(
+                parser.get_cache_key(content, "html"), get_minified
+            )
 
         return wrapper
 
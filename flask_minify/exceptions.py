@@ -1,2 +1,6 @@
 class FlaskMinifyException(Exception):
     """FlaskMinify base exception"""
+
+
+class MinifyTimeout(FlaskMinifyException):
+    """Minifying did not finish within its time budget"""
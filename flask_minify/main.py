@@ -1,16 +1,46 @@
-from itertools import tee
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import suppress
+from glob import glob
+from mimetypes import guess_type
 from re import compile as compile_re
-
-from flask import current_app, request
-
-from flask_minify.cache import MemoryCache
+from tempfile import mkstemp
+from threading import BoundedSemaphore, Lock, Thread, local
+
+from flask import (
+    current_app,
+    has_request_context,
+    request,
+    send_file,
+    send_from_directory,
+)
+from werkzeug.security import safe_join
+
+from flask_minify.cache import MemoryCache, MinifiedContent, TieredCache
+from flask_minify.cli import minify as minify_cli
+from flask_minify.exceptions import MinifyTimeout
 from flask_minify.parsers import Parser
-from flask_minify.utils import does_content_type_match
+from flask_minify.templates import MinifyTemplates
+from flask_minify.utils import (
+    EndpointMatcher,
+    does_content_type_match,
+    get_compressed_encodings,
+    get_optimized_hashing,
+    get_static_folders,
+    mask_volatile_values,
+    unmask_volatile_values,
+)
 
 
 class Minify:
     "Extension to minify flask response for html, javascript, css and less."
 
+    manifest_name = "minify-manifest.json"
+    static_tags = {".js": "script", ".css": "style", ".less": "style"}
+    endpoint_matchers_limit = 8
+
     def __init__(
         self,
         app=None,
@@ -20,12 +50,31 @@ class Minify:
         fail_safe=True,
         bypass=[],
         bypass_caching=[],
+        volatile=[],
         caching_limit=2,
+        caching_size_limit=0,
+        caching_policy="lru",
+        caching_store_limit=1000,
+        caching_store_ttl=0,
+        caching_memory_limit=0,
+        caching_inline_limit=100,
+        cache_backend=None,
         passive=False,
         static=True,
+        static_manifest=False,
+        static_cache_dir=None,
         script_types=[],
         parsers={},
         go=True,
+        compress=False,
+        etag=False,
+        stream=False,
+        templates=False,
+        workers=0,
+        queue_limit=0,
+        time_budget=0.1,
+        processes=0,
+        lazy=False,
     ):
         """Extension to minify flask response for html, javascript, css and less.
 
@@ -45,18 +94,68 @@ class Minify:
             list of endpoints to bypass minifying for. (Regex)
         bypass_caching: list
             list of endpoints to bypass caching for. (Regex)
+        volatile: list
+            list of patterns of per-request values, such as CSP nonces and
+            CSRF tokens, to leave out of the cached responses. (Regex)
         caching_limit: int
             to limit the number of minified response variations.
+        caching_size_limit: int
+            to limit the size of minified response variations in bytes.
+        caching_policy: str
+            cache eviction policy, either "lru" or "lfu".
+        caching_store_limit: int
+            to limit the number of endpoints with cached responses, `0` for
+            no limit.
+        caching_store_ttl: int
+            seconds after which an idle endpoint's cached responses are dropped.
+        caching_memory_limit: int
+            to limit the size of all cached responses in bytes.
+        caching_inline_limit: int
+            to limit the number of minified inline script and style blocks
+            cached by their content, regardless of the page they're in.
+        cache_backend: CacheBase or list
+            cache instance to use instead of the default `MemoryCache`, or
+            list of caches to compose into a `TieredCache`.
         passive: bool
             to disable active minifying.
         static: bool
             to enable minifying static files css, less and js.
+        static_manifest: bool
+            to serve static files minified ahead of time by `flask minify build`.
+        static_cache_dir: str
+            directory to minify static files into once, to serve them from.
         script_types: list
             list of script types to limit js minification to.
         parsers: dict
             parsers to handle minifying specific tags.
         go: bool
             use optimized golang minifier if available.
+        compress: bool
+            to cache compressed minified responses, and serve them to the
+            clients accepting their content encoding.
+        etag: bool
+            to set the minified responses ETag, and answer requests with a
+            matching `If-None-Match` with 304 Not Modified.
+        stream: bool
+            to minify streamed html responses chunk by chunk, keeping them
+            streamed instead of buffering them.
+        templates: bool
+            to minify html templates once when they're compiled, instead of
+            minifying their rendered output on every request.
+        workers: int
+            number of threads to minify responses in, within `time_budget`,
+            `0` to minify them in the request thread.
+        queue_limit: int
+            to limit the number of responses waiting for a worker thread.
+        time_budget: float
+            seconds to wait for a worker thread to minify the response,
+            before serving it as it is, `0` not to wait for it.
+        processes: int
+            number of worker processes to minify content larger than 1KB in,
+            `0` to minify it in the current process.
+        lazy: bool
+            to serve responses missing the cache as they are, right away, while
+            a worker thread minifies them into the cache.
 
         Notes
         -----
@@ -88,12 +187,55 @@ class Minify:
         self.fail_safe = fail_safe
         self.bypass = bypass
         self.bypass_caching = bypass_caching
+        self.volatile = volatile
         self._app = app
         self.passive = passive
         self.static = static
+        self.static_manifest = static_manifest
+        self.static_cache_dir = static_cache_dir
+        self.hashing = get_optimized_hashing()
         self.go = go
-        self.cache = MemoryCache(self.get_endpoint, caching_limit)
-        self.parser = Parser(parsers, fail_safe, go=go)
+        self.compress = compress
+        self.etag = etag
+        self.stream = stream
+        self.templates = templates
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.time_budget = time_budget
+        self.lazy = lazy
+        self._executor = None
+        self._executor_slots = None
+        self._executor_lock = Lock()
+        self._worker = local()
+        self._warmed_up = False
+        self._static_folders = None
+        self._manifests = {}
+        self._static_versions = {}
+        self._endpoint_matchers = {}
+
+        if isinstance(cache_backend, (list, tuple)):
+            cache_backend = TieredCache(*cache_backend)
+
+        self.cache = cache_backend or MemoryCache(
+            self.get_endpoint,
+            caching_limit,
+            caching_size_limit,
+            caching_policy,
+            caching_store_limit,
+            caching_store_ttl,
+            caching_memory_limit,
+        )
+
+        if not self.cache.store_key_getter:
+            self.cache.store_key_getter = self.get_endpoint
+
+        self.parser = Parser(
+            parsers,
+            fail_safe,
+            go=go,
+            inline_caching_limit=caching_inline_limit,
+            processes=processes,
+        )
         self.parser.update_runtime_options(html, js, cssless, script_types)
 
         app and self.init_app(app)
@@ -101,18 +243,34 @@ class Minify:
     def get_endpoint(self):
         """Get the current response endpoint, with a failsafe.
 
+        The endpoint is resolved once per request, and stashed on it for the
+        bypass checks and the cache store lookups. worker threads caching the
+        content minified late get the endpoint of the request it belongs to.
+
         Returns
         -------
         str
             the current endpoint.
         """
-        with self.app.app_context():
+        endpoint = getattr(self._worker, "endpoint", None)
+
+        if endpoint is not None:
+            return endpoint
+
+        if not has_request_context():
+            return ""
+
+        path = getattr(request, "minify_endpoint", None)
+
+        if path is None:
             path = getattr(request, "endpoint", "") or ""
 
             if path == "static":
                 path = getattr(request, "path", "") or ""
 
-            return path
+            request.minify_endpoint = path
+
+        return path
 
     @property
     def app(self):
@@ -128,14 +286,95 @@ class Minify:
     def init_app(self, app):
         """Handle initiation of multiple apps NOTE:Factory Method"""
         self._app = app
+        app.extensions.setdefault("minify", self)
+        app.before_request(self.warm_up)
+        app.before_request(self.serve_static)
         app.after_request(self.main)
         app.teardown_appcontext(self.teardown)
+        app.cli.add_command(minify_cli)
+
+        if self.templates:
+            app.jinja_env.add_extension(MinifyTemplates)
+            app.jinja_env.minify_parser = self.parser
+            app.jinja_env.minify_rendered = self.mark_minified_template
+
+    def warm_up(self):
+        """Start the worker processes in the background on the first request,
+        once the app server forked its workers, so the first content minified
+        in them doesn't wait for them to start."""
+        if self.parser.processes and not self._warmed_up:
+            self._warmed_up = True
+            Thread(
+                target=self.parser.warm_up, name="flask_minify_warm_up", daemon=True
+            ).start()
+
+    def mark_minified_template(self, rendered):
+        """Keep the output of a minified template rendered by the current
+        request, to skip minifying the response if it's that output.
+
+        Parameters
+        ----------
+        rendered: str
+            output of the minified template.
+        """
+        if has_request_context():
+            rendered_templates = getattr(request, "minified_templates", None)
+
+            if rendered_templates is None:
+                rendered_templates = request.minified_templates = set()
+
+            rendered_templates.add(rendered)
+
+    def is_minified_template(self, response):
+        """Check if the response content is the output of a minified template,
+        rather than of other templates rendered by the request, such as emails.
+
+        Parameters
+        ----------
+        response: Flask.response
+            response to check the content of.
+
+        Returns
+        -------
+        bool
+            True if the response content is a minified template output.
+        """
+        rendered_templates = getattr(request, "minified_templates", None)
+
+        return bool(
+            rendered_templates
+            and not response.is_streamed
+            and response.get_data(as_text=True) in rendered_templates
+        )
 
     def teardown(self, exception):
         """Nothing todo on app context teardown XXX:Factory Method"""
         pass
 
-    def get_minified_or_cached(self, content, tag):
+    @property
+    def caching_disabled(self):
+        """True if `caching_limit` is set to 0, so nothing is ever cached."""
+        return isinstance(self.cache, MemoryCache) and self.cache.limit == 0
+
+    def get_cache_key(self, key, tag):
+        """Get the cache key of the minified content, distinct per tag, parsers
+        options, compression and ETag, since the cache backend may be shared.
+
+        Parameters
+        ----------
+        key: str
+            content, or key identifying it.
+        tag: str
+            html tag the content belongs to.
+
+        Returns
+        -------
+        str
+            cache key of the minified content.
+        """
+        return self.parser.get_cache_key(key, tag, self.compress, self.etag)
+
+    def get_minified_or_cached(self, content, tag, endpoint=None):
         """Check if the content is already cached and restore or store it.
 
         Parameters
@@ -144,41 +383,462 @@ class Minify:
             a script or style html tag content.
         tag: bool
             html tag the content belongs to.
+        endpoint: str
+            endpoint the content belongs to, instead of the current one.
 
         Returns
         -------
         str
             stored or restored minifed content.
+
+        Notes
+        -----
+        the `volatile` values are swapped with placeholders before caching,
+        so content differing only by them is minified and cached once. the
+        restored content has no compressed variants nor ETag, since they don't
+        match the values.
         """
-        _, bypassed = self.get_endpoint_matches(self.bypass_caching)
-        get_minified = lambda: self.parser.minify(content, tag)
+        _, bypassed = self.get_endpoint_matches(self.bypass_caching, endpoint)
+        cached = not (bypassed or self.caching_disabled)
+        content, values = mask_volatile_values(content, self.volatile)
+        key = self.get_cache_key(content, tag)
+        get_minified = lambda: self.get_minified(content, tag)
+
+        # without caching, lazily minified content would never be served
+        if self.workers or (self.lazy and cached):
+            get_minified = lambda: self.get_minified_in_time(
+                content, tag, key if cached else None
+            )
+
+        try:
+            minified = (
+                self.cache.get_or_set(key, get_minified) if cached else get_minified()
+            )
+        except MinifyTimeout:
+            minified = content
+
+        return unmask_volatile_values(minified, values) if values else minified
+
+    def get_static_minified_or_cached(self, response, folder, tag, endpoint=None):
+        """Check if the static file is already cached, without reading it, and
+        restore or store it.
+
+        Static files are cached per path, modification time, size and inode,
+        so a cache hit skips reading and hashing the file content. Partial
+        responses are cached by their content instead, so they never take
+        the place of the whole file.
 
-        if bypassed:
-            return get_minified()
+        Parameters
+        ----------
+        response: Flask.response
+            static file response.
+        folder: str
+            path of the static folder.
+        tag: str
+            html tag the static file content belongs to.
+        endpoint: str
+            endpoint the static file belongs to, instead of the current one.
 
-        return self.cache.get_or_set(content, get_minified)
+        Returns
+        -------
+        str
+            stored or restored minifed content.
+        """
+        filename = (request.view_args or {}).get("filename", "")
+        path = safe_join(folder, filename)
+        _, bypassed = self.get_endpoint_matches(self.bypass_caching, endpoint)
+
+        try:
+            stat = os.stat(path) if path else None
+        except OSError:
+            stat = None
+
+        partial = response.status_code != 200 or "Content-Range" in response.headers
+
+        if bypassed or self.caching_disabled or stat is None or partial:
+            return self.get_minified_or_cached(
+                self.get_content(response), tag, endpoint
+            )
+
+        key = self.get_cache_key(
+            "{0}:{1}:{2}:{3}".format(path, stat.st_mtime_ns, stat.st_size, stat.st_ino),
+            tag,
+        )
+        previous_key = self._static_versions.get(path)
+
+        if previous_key != key:
+            if previous_key is not None:
+                self.invalidate_static(path, previous_key)
+
+            self._static_versions[path] = key
+
+        get_minified = lambda: self.get_minified(self.get_content(response), tag)
+
+        if self.workers or self.lazy:
+            get_minified = lambda: self.get_minified_in_time(
+                self.get_content(response), tag, key
+            )
+
+        try:
+            return self.cache.get_or_set(key, get_minified)
+        except MinifyTimeout:
+            return self.get_content(response)
+
+    def get_minified(self, content, tag):
+        """Minify the response content, with its cached variants if enabled.
+
+        Parameters
+        ----------
+        content: str
+            response content.
+        tag: str
+            html tag the content belongs to.
+
+        Returns
+        -------
+        str
+            minifed content.
+        """
+        minified = self.parser.minify(content, tag)
+
+        if self.compress or self.etag:
+            minified = MinifiedContent(minified)
+
+        if self.compress:
+            minified.encodings = get_compressed_encodings(minified)
+
+        if self.etag:
+            minified.etag = self.hashing(minified.encode("utf-8")).hexdigest()
+
+        return minified
+
+    @property
+    def executor(self):
+        """Worker threads pool, created on first use so it's not forked.
+
+        Returns
+        -------
+        ThreadPoolExecutor
+            pool of `workers` threads, at least one, to minify responses in.
+        """
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    workers = max(self.workers, 1)
+                    self._executor_slots = BoundedSemaphore(workers + self.queue_limit)
+                    self._executor = ThreadPoolExecutor(
+                        workers, thread_name_prefix="flask_minify"
+                    )
+
+        return self._executor
+
+    def get_minified_in_time(self, content, tag, key=None):
+        """Minify the response content in a worker thread, within the time budget,
+        or without waiting for it if `lazy` is enabled.
+
+        Parameters
+        ----------
+        content: str
+            response content.
+        tag: str
+            html tag the content belongs to.
+        key: str
+            cache key to store the minified content under once it's ready, if
+            not in time, otherwise it's waited for within `time_budget` even if
+            `lazy`.
+
+        Returns
+        -------
+        str
+            minifed content.
 
-    def get_endpoint_matches(self, patterns):
+        Raises
+        ------
+        MinifyTimeout
+            if the workers queue is full, or the content is not minified
+            within `time_budget`.
+        """
+        executor = self.executor
+        slots = self._executor_slots
+
+        if not slots.acquire(blocking=False):
+            raise MinifyTimeout("Workers queue is full")
+
+        future = executor.submit(self.get_minified, content, tag)
+        future.add_done_callback(lambda _: slots.release())
+
+        try:
+            lazy = self.lazy and key is not None
+
+            return future.result(0 if lazy else self.time_budget)
+        except FutureTimeoutError:
+            if key is not None:
+                # resolved here, so the request context is never replayed
+                endpoint = self.get_endpoint()
+
+                def cache_minified(future):
+                    if not future.exception():
+                        self._worker.endpoint = endpoint
+
+                        try:
+                            self.cache.get_or_set(key, future.result)
+                        finally:
+                            del self._worker.endpoint
+
+                future.add_done_callback(cache_minified)
+
+            raise MinifyTimeout(f"Minifying exceeded {self.time_budget}s") from None
+
+    def set_minified(self, response, minified):
+        """Set the minified content, negotiating its content encoding and ETag.
+
+        Parameters
+        ----------
+        response: Flask.response
+            response to set the content of.
+        minified: str
+            minified content.
+        """
+        encodings = getattr(minified, "encodings", None)
+        etag = getattr(minified, "etag", None) if self.etag else None
+        encoding = None
+        cacheable = response.status_code == 200
+
+        if self.compress:
+            response.vary.add("Accept-Encoding")
+
+        if (
+            encodings
+            and self.compress
+            and cacheable
+            and "Content-Encoding" not in response.headers
+        ):
+            encoding = request.accept_encodings.best_match(encodings)
+
+        if etag and cacheable:
+            # strong ETags must differ between content encodings
+            etag = "{0}-{1}".format(etag, encoding) if encoding else etag
+            response.set_etag(etag)
+
+            if request.method in (
+                "GET",
+                "HEAD",
+            ) and request.if_none_match.contains_weak(etag):
+                response.status_code = 304
+                return
+
+        if encoding:
+            response.set_data(encodings[encoding])
+            response.headers["Content-Encoding"] = encoding
+        else:
+            response.set_data(minified)
+
+    def invalidate_static(self, path, key):
+        """Drop the cached minified static file, once it is modified.
+
+        Parameters
+        ----------
+        path: str
+            path of the modified static file.
+        key: str
+            cache key of its outdated version.
+        """
+        del self.cache[self.cache.hash_key(key)]
+
+    def get_content(self, response):
+        """Read the response content, turning off its direct passthrough."""
+        response.direct_passthrough = False
+
+        return response.get_data(as_text=True)
+
+    def get_endpoint_matcher(self, patterns):
+        """Get the matcher of the patterns, renewed once they change.
+
+        Parameters
+        ----------
+        patterns: list
+            regex patterns or strings to match endpoints.
+
+        Returns
+        -------
+        EndpointMatcher
+            matcher of the patterns, compiled once.
+        """
+        matcher = self._endpoint_matchers.get(id(patterns))
+
+        if matcher is None or matcher.patterns != patterns:
+            if len(self._endpoint_matchers) >= self.endpoint_matchers_limit:
+                self._endpoint_matchers.clear()
+
+            matcher = self._endpoint_matchers[id(patterns)] = EndpointMatcher(patterns)
+
+        return matcher
+
+    def get_endpoint_matches(self, patterns, endpoint=None):
         """Get the patterns that matches the current endpoint.
 
         Parameters
         ----------
         patterns: list
             regex patterns or strings to match endpoint.
+        endpoint: str
+            endpoint to match instead of the current one.
 
         Returns
         -------
         (iterable, bool)
             patterns that match the current endpoint, and True if any matches found
         """
-        endpoint = self.get_endpoint()
-        matches, duplicates = tee(
-            p for p in map(compile_re, patterns) if p.search(endpoint)
+        endpoint = self.get_endpoint() if endpoint is None else endpoint
+        has_matches = self.get_endpoint_matcher(patterns)(endpoint)
+        matches = (
+            (p for p in map(compile_re, patterns) if p.search(endpoint))
+            if has_matches
+            else iter(())
         )
-        has_matches = next(duplicates, 0) != 0
 
         return matches, has_matches
 
+    def get_static_tag(self, filename):
+        """Get the tag to minify a static file as, if it should be minified.
+
+        Parameters
+        ----------
+        filename: str
+            name of the static file.
+
+        Returns
+        -------
+        str
+            html tag the file content belongs to, or None.
+        """
+        tag = self.static_tags.get(os.path.splitext(filename)[1].lower())
+        enabled = self.static and (self.js if tag == "script" else self.cssless)
+
+        return tag if enabled else None
+
+    @property
+    def static_folders(self):
+        if self._static_folders is None:
+            self._static_folders = get_static_folders(self.app)
+
+        return self._static_folders
+
+    def get_manifest(self, folder):
+        """Get the minified files of a static folder, built by `flask minify build`.
+
+        Parameters
+        ----------
+        folder: str
+            path of the static folder.
+
+        Returns
+        -------
+        dict
+            static files paths and their minified files paths.
+        """
+        manifest = self._manifests.get(folder)
+
+        if manifest is None:
+            try:
+                with open(os.path.join(folder, self.manifest_name)) as f:
+                    manifest = json.load(f)
+            except FileNotFoundError:
+                manifest = {}
+
+            self._manifests[folder] = manifest
+
+        return manifest
+
+    def get_static_minified_path(self, folder, filename):
+        """Get the path of the static file minified into `static_cache_dir`.
+
+        The static file is minified once per path, modification time and size,
+        and the previously minified versions of it are removed.
+
+        Parameters
+        ----------
+        folder: str
+            path of the static folder.
+        filename: str
+            path of the static file relative to its folder.
+
+        Returns
+        -------
+        str
+            path of the minified static file, or None if it should not be minified.
+        """
+        tag = self.get_static_tag(filename)
+        source = safe_join(folder, filename)
+        _, bypassed = self.get_endpoint_matches(self.bypass)
+
+        if not tag or bypassed or source is None:
+            return None
+
+        try:
+            stat = os.stat(source)
+        except OSError:
+            return None
+
+        path_key = self.hashing(source.encode("utf-8")).hexdigest()
+        version = "{0}:{1}".format(stat.st_mtime_ns, stat.st_size)
+        version_key = self.hashing(version.encode("utf-8")).hexdigest()
+        extension = os.path.splitext(filename)[1]
+        path = os.path.join(
+            self.static_cache_dir,
+            "{0}.{1}{2}".format(path_key, version_key, extension),
+        )
+
+        if not os.path.exists(path):
+            with open(source, encoding="utf-8") as f:
+                minified = self.parser.minify(f.read(), tag)
+
+            os.makedirs(self.static_cache_dir, exist_ok=True)
+            fd, temp_path = mkstemp(dir=self.static_cache_dir, suffix=".tmp")
+
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(minified)
+
+            os.replace(temp_path, path)
+            stale_pattern = "{0}.*{1}".format(path_key, extension)
+
+            for stale_path in glob(os.path.join(self.static_cache_dir, stale_pattern)):
+                if stale_path != path:
+                    # another worker may have removed it already
+                    with suppress(FileNotFoundError):
+                        os.remove(stale_path)
+
+        return path
+
+    def serve_static(self):
+        """Serve the minified static file ahead of the `static` endpoint.
+
+        Returns
+        -------
+        Flask.Response
+            minified static file response if there's any, otherwise None.
+        """
+        folder = self.static_folders.get(request.endpoint)
+
+        if not folder or self.passive:
+            return None
+
+        filename = (request.view_args or {}).get("filename", "")
+        mimetype = guess_type(filename)[0]
+        minified = self.static_manifest and self.get_manifest(folder).get(filename)
+        response = None
+
+        if minified:
+            response = send_from_directory(folder, minified, mimetype=mimetype)
+        elif self.static_cache_dir:
+            path = self.get_static_minified_path(folder, filename)
+            response = path and send_file(path, mimetype=mimetype)
+
+        if response:
+            response.minified = True
+
+        return response
+
     def main(self, response):
         """Where a dragon once lived!
 
@@ -192,20 +852,42 @@ class Minify:
         Flask.Response
             minified flask response if it fits the requirements.
         """
-        _, bypassed = self.get_endpoint_matches(self.bypass)
+        if getattr(response, "minified", False):
+            return response
+
+        endpoint = self.get_endpoint()
+        _, bypassed = self.get_endpoint_matches(self.bypass, endpoint)
         should_bypass = bypassed or self.passive
         html, cssless, js = does_content_type_match(response)
         should_minify = (
             (html and self.html) or (cssless and self.cssless) or (js and self.js)
         )
 
-        if should_minify and not should_bypass:
-            if html or (self.static and (cssless or js)):
-                response.direct_passthrough = False
-                content = response.get_data(as_text=True)
+        if (
+            should_minify
+            and not should_bypass
+            and not self.is_minified_template(response)
+        ):
+            if html and self.stream and response.is_streamed:
+                response.response = self.parser.minify_stream(response.response)
+                response.headers.pop("Content-Length", None)
+            elif html or (self.static and (cssless or js)):
                 tag = "html" if html else "script" if js else "style"
-                minified = self.get_minified_or_cached(content, tag)
-
-                response.set_data(minified)
+                folder = self.static_folders.get(request.endpoint)
+
+                if folder:
+                    minified = self.get_static_minified_or_cached(
+                        response, folder, tag, endpoint
+                    )
+                else:
+                    content = self.get_content(response)
+                    minified = self.get_minified_or_cached(content, tag, endpoint)
+
+                if response.direct_passthrough:
+                    # the static file was not read, its minified version was cached
+                    response.direct_passthrough = False
+                    getattr(response.response, "close", lambda: None)()
+
+                self.set_minified(response, minified)
 
         return response
@@ -1,6 +1,12 @@
 from abc import ABCMeta, abstractmethod
-from functools import lru_cache
+from codecs import getincrementaldecoder
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from copy import deepcopy
 from io import StringIO
+from multiprocessing import get_all_start_methods, get_context
+from threading import Condition, Lock
 from typing import Any, Dict
 
 from htmlmin import minify as minify_html
@@ -13,8 +19,13 @@ try:
 except Exception:
     minify_go = None
 
+from flask_minify.cache import MemoryCache
 from flask_minify.exceptions import FlaskMinifyException
-from flask_minify.utils import get_tag_contents
+from flask_minify.utils import (
+    get_complete_html_end,
+    get_optimized_hashing,
+    replace_tag_contents,
+)
 
 
 class ParserBase(metaclass=ABCMeta):
@@ -73,33 +84,87 @@ class Html(ParserMixin):
         only_html_content = options.pop("only_html_content", False)
         script_types = options.pop("script_types", [])
         minify_inline = options.pop("minify_inline", self._default_tags)
-        enabled_tags = (t for t, e in minify_inline.items() if e)
+        enabled_tags = tuple(t for t, e in minify_inline.items() if e)
 
-        for tag in enabled_tags:
-            for sub_content in get_tag_contents(content, tag, script_types):
-                minified = self.parser.minify(sub_content, tag)
-                content = content.replace(sub_content, minified)
+        if enabled_tags:
+            content = replace_tag_contents(
+                content, enabled_tags, script_types, self.parser.minify_inline
+            )
 
         return content if only_html_content else minify_html(content, **options)
 
 
+class GoConfig:
+    """Configuration of the Go minifier, which is global to the process.
+
+    Many threads can minify with the current options at once, while changing
+    them waits for those threads to finish, and holds back the new ones.
+    """
+
+    def __init__(self):
+        self.condition = Condition()
+        self.options = None
+        self.users = 0
+        self.changes = 0
+
+    @contextmanager
+    def configured(self, options):
+        """Minify with the Go minifier configured with the given options.
+
+        Parameters
+        ----------
+        options: dict
+            options of all the Go parsers, only applied if they changed.
+        """
+        with self.condition:
+            changing = False
+
+            while self.users and (self.options != options or self.changes > changing):
+                if not changing and self.options != options:
+                    changing = True
+                    self.changes += 1
+
+                self.condition.wait()
+
+            self.changes -= changing
+
+            if self.options != options:
+                self.options = None
+                minify_go.config(options)
+                self.options = options
+
+            self.users += 1
+
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.users -= 1
+
+                if not self.users:
+                    self.condition.notify_all()
+
+
+go_config = GoConfig()
+
+
 class GoParserMixin(ParserMixin):
     go = True
     media_type = "text/html"
 
-    @lru_cache(10)
     def get_all_go_options(self):
         all_options = {}
 
-        for parser in self.parser.parsers.values():
-            if parser.go:
-                all_options.update(parser.runtime_options)
+        for tag, parser_class in self.parser.parsers.items():
+            if parser_class.go:
+                parser = parser_class()
+                all_options.update(self.parser.merge_runtime_options(parser, tag))
 
         return all_options
 
     def executer(self, content, **options):
-        minify_go.config({**self.get_all_go_options(), **options})
-        return minify_go.string(self.media_type, content)
+        with go_config.configured(options):
+            return minify_go.string(self.media_type, content)
 
 
 class HtmlGo(GoParserMixin):
@@ -127,6 +192,28 @@ class CssGo(GoParserMixin):
     runtime_options = _o = {"css-precision": 0}
 
 
+process_parser = None
+
+
+def init_process_parser(parsers, fail_safe, go, inline_caching_limit):
+    """Warm up a worker process, with its parsers and their modules ready."""
+    global process_parser
+    process_parser = Parser(
+        parsers, fail_safe, go=go, inline_caching_limit=inline_caching_limit
+    )
+
+
+def warm_up_process():
+    """Nothing to do, the worker process is warmed up once it's started."""
+
+
+def minify_in_process(content, tag, runtime_options):
+    """Minify the content with the worker process parser."""
+    process_parser.runtime_options = runtime_options
+
+    return process_parser.minify(content, tag)
+
+
 class Parser:
     _default_parsers = {"html": Html, "script": Jsmin, "style": Rcssmin}
     _go_default_parsers = {"html": HtmlGo, "script": JsGo, "style": CssGo}
@@ -137,11 +224,22 @@ class Parser:
         fail_safe=False,
         runtime_options={},
         go=False,
+        inline_caching_limit=0,
+        processes=0,
+        process_min_size=1024,
     ):
         self.go = go
         self.parsers = {**self.default_parsers, **parsers}
         self.runtime_options = {**runtime_options}
         self.fail_safe = fail_safe
+        self.inline_cache = MemoryCache(limit=inline_caching_limit)
+        self.processes = processes
+        self.process_min_size = process_min_size
+        self._executor = None
+        self._executor_lock = Lock()
+        self._prepared = {}
+        self._prepared_for = None
+        self._options_key = None
 
         if self.has_go_parser and not minify_go:
             raise FlaskMinifyException(
@@ -174,28 +272,211 @@ class Parser:
                 }
             )
 
-    def minify(self, content, tag):
+    def __getstate__(self):
+        # worker processes pools and locks can't be shared with other processes
+        state = {
+            "_executor": None,
+            "_executor_lock": None,
+            "_prepared": {},
+            "_prepared_for": None,
+        }
+
+        return {**self.__dict__, **state}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _executor_lock=Lock())
+
+    @property
+    def executor(self):
+        """Worker processes pool, created on first use so it's not forked.
+
+        Returns
+        -------
+        ProcessPoolExecutor
+            pool of `processes` warmed up worker processes.
+        """
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    methods = get_all_start_methods()
+                    method = "forkserver" if "forkserver" in methods else "spawn"
+                    self._executor = ProcessPoolExecutor(
+                        self.processes,
+                        mp_context=get_context(method),
+                        initializer=init_process_parser,
+                        initargs=(
+                            self.parsers,
+                            self.fail_safe,
+                            self.go,
+                            self.inline_cache.limit,
+                        ),
+                    )
+
+        return self._executor
+
+    def warm_up(self):
+        """Start the worker processes, with their parsers ready, ahead of the
+        first content large enough to be minified in them.
+
+        Returns
+        -------
+        list
+            futures of the jobs starting the worker processes.
+        """
+        if not self.processes:
+            return []
+
+        executor = self.executor
+
+        return [executor.submit(warm_up_process) for _ in range(self.processes)]
+
+    def merge_runtime_options(self, parser, tag):
+        """Merge the parser's own runtime options with the tag's ones.
+
+        Parameters
+        ----------
+        parser: ParserMixin
+            parser of the tag.
+        tag: str
+            tag of the content to minify.
+
+        Returns
+        -------
+        dict
+            merged runtime options.
+        """
+        if parser.options_changed:
+            return parser.runtime_options
+
+        options = self.runtime_options.get(tag, {})
+
+        if parser.takes_precedence:
+            return {**options, **parser.runtime_options}
+
+        return {**parser.runtime_options, **options}
+
+    def renew_prepared(self):
+        """Drop the prepared parsers once the parsers or the runtime options
+        change, and renew the digest identifying them."""
+        prepared_for = self._prepared_for
+
+        if (
+            prepared_for is None
+            or prepared_for[0] != self.parsers
+            or prepared_for[1] != self.runtime_options
+        ):
+            prepared_for = ({**self.parsers}, deepcopy(self.runtime_options))
+            parsers = {t: (p, p.runtime_options) for t, p in prepared_for[0].items()}
+            options = repr((parsers, prepared_for[1])).encode("utf-8")
+            self._options_key = get_optimized_hashing()(options).hexdigest()
+            self._prepared = {}
+            # published last, so threads seeing it match get the renewed key
+            self._prepared_for = prepared_for
+
+    def get_cache_key(self, key, tag, *variants):
+        """Get the cache key of content minified as the tag, distinct per
+        parsers and options, so instances sharing a cache backend don't get
+        each other's minified content.
+
+        Parameters
+        ----------
+        key: str
+            content, or key identifying it.
+        tag: str
+            tag of the content to minify.
+        variants: any
+            other settings the cached content depends on, such as compression.
+
+        Returns
+        -------
+        str
+            cache key of the minified content.
+        """
+        self.renew_prepared()
+
+        return f"{self._options_key}{(tag, *variants)}{key}"
+
+    def get_prepared(self, tag):
+        """Get the tag's parser instance, with its merged runtime options.
+
+        They're prepared on first use, and again only once the parsers or
+        the runtime options change, so minifying many inline blocks doesn't
+        instantiate a parser nor merge options for each of them.
+
+        Parameters
+        ----------
+        tag: str
+            tag of the content to minify.
+
+        Returns
+        -------
+        tuple
+            parser instance, its merged runtime options, not to be changed,
+            and the key identifying both.
+        """
+        self.renew_prepared()
+        prepared = self._prepared.get(tag)
+
+        if prepared:
+            return prepared
+
         if tag not in self.parsers:
             raise FlaskMinifyException('Unknown tag "{0}"'.format(tag))
 
         parser = self.parsers[tag]()
         parser.parser = self
+        # the go minifier is configured once, with the options of all the tags
+        runtime_options = (
+            parser.get_all_go_options()
+            if parser.go
+            else self.merge_runtime_options(parser, tag)
+        )
+        options = (self.parsers[tag], self._prepared_for[1].get(tag))
+        prepared = (parser, runtime_options, f"{tag}{options}")
+        self._prepared[tag] = prepared
+
+        return prepared
+
+    def minify_in_processes(self, content, tag):
+        """Minify the content in a worker process, or in the current one if
+        the pool is broken, renewing it for the next contents.
+
+        Parameters
+        ----------
+        content: str
+            content to minify.
+        tag: str
+            tag of the content to minify.
+
+        Returns
+        -------
+        str
+            minified content.
+        """
+        executor = self.executor
 
-        if parser.options_changed:
-            runtime_options = parser.runtime_options
-        elif parser.takes_precedence:
-            runtime_options = {
-                **self.runtime_options.get(tag, {}),
-                **parser.runtime_options,
-            }
-        else:
-            runtime_options = {
-                **parser.runtime_options,
-                **self.runtime_options.get(tag, {}),
-            }
+        try:
+            return executor.submit(
+                minify_in_process, content, tag, self.runtime_options
+            ).result()
+        except BrokenProcessPool:
+            # a worker process died, so the pool no longer accepts any work
+            if self._executor is executor:
+                self._executor = None
+
+            executor.shutdown(wait=False)
+            parser, runtime_options, _ = self.get_prepared(tag)
+
+            return parser.executer(content, **runtime_options)
+
+    def minify(self, content, tag):
+        parser, runtime_options, _ = self.get_prepared(tag)
 
         try:
-            minified_or_content = parser.executer(content, **runtime_options)
+            if self.processes and len(content) >= self.process_min_size:
+                minified_or_content = self.minify_in_processes(content, tag)
+            else:
+                minified_or_content = parser.executer(content, **runtime_options)
         except Exception as e:
             if not self.fail_safe:
                 raise FlaskMinifyException(
@@ -205,3 +486,59 @@ class Parser:
             minified_or_content = content
 
         return minified_or_content
+
+    def minify_inline(self, content, tag):
+        """Minify an inline script or style block, caching it by its digest.
+
+        The same blocks, shared by many pages, are minified once even when
+        the pages as a whole are not cached.
+
+        Parameters
+        ----------
+        content: str
+            content of the inline block.
+        tag: str
+            tag of the inline block.
+
+        Returns
+        -------
+        str
+            minified content of the inline block.
+        """
+        key = self.get_prepared(tag)[2] + content
+
+        return self.inline_cache.get_or_set(key, lambda: self.minify(content, tag))
+
+    def minify_stream(self, chunks, tag="html"):
+        """Minify streamed html content, as its chunks arrive.
+
+        Incomplete tags, comments and script, style, pre and textarea blocks
+        are held back until the chunks completing them arrive.
+
+        Parameters
+        ----------
+        chunks: iterable
+            chunks of the content, str or utf-8 encoded bytes.
+        tag: str
+            html tag the content belongs to.
+
+        Returns
+        -------
+        generator
+            minified chunks of the content.
+        """
+        decoder = getincrementaldecoder("utf-8")()
+        pending = ""
+
+        for chunk in chunks:
+            pending += decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+            end = get_complete_html_end(pending)
+
+            if end:
+                yield self.minify(pending[:end], tag)
+                pending = pending[end:]
+
+        pending += decoder.decode(b"", final=True)
+
+        if pending:
+            yield self.minify(pending, tag)
@@ -0,0 +1,135 @@
+from functools import lru_cache
+from re import DOTALL
+from re import compile as compile_re
+from re import escape
+from uuid import uuid4
+
+from jinja2.ext import Extension
+
+
+@lru_cache(maxsize=8)
+def get_template_syntax_regex(block, variable, comment):
+    """Get regex matching the template syntax, for the given delimiters.
+
+    Parameters
+    ----------
+    block: tuple
+        block start and end delimiters.
+    variable: tuple
+        variable start and end delimiters.
+    comment: tuple
+        comment start and end delimiters.
+
+    Returns
+    -------
+    re.Pattern
+        compiled regex matching raw blocks, blocks, variables and comments.
+    """
+    start, end = (escape(d) for d in block)
+    raw = r"{0}-?\s*raw\s*-?{1}.*?{0}-?\s*endraw\s*-?{1}".format(start, end)
+    delimiters = [
+        r"{0}.*?{1}".format(*map(escape, d)) for d in (block, variable, comment)
+    ]
+
+    return compile_re("|".join([raw, *delimiters]), DOTALL)
+
+
+@lru_cache(maxsize=8)
+def get_reporting_template_class(template_class):
+    """Get the template class reporting the output of the minified templates.
+
+    Parameters
+    ----------
+    template_class: type
+        template class of the environment to extend.
+
+    Returns
+    -------
+    type
+        template class passing the output of the templates it minified to the
+        environment's `minify_rendered`, if set.
+    """
+
+    class ReportingTemplate(template_class):
+        reports_rendered = True
+
+        def render(self, *args, **kwargs):
+            rendered = super().render(*args, **kwargs)
+            environment = self.environment
+            extension = environment.extensions.get(MinifyTemplates.identifier)
+
+            if environment.minify_rendered and extension:
+                if extension.should_minify(self.name):
+                    environment.minify_rendered(rendered)
+
+            return rendered
+
+    return ReportingTemplate
+
+
+class MinifyTemplates(Extension):
+    """Jinja extension minifying the html templates source, once when they're
+    compiled, leaving the template syntax intact.
+
+    The environment's `minify_parser` is used to minify the templates, if set,
+    and its `minify_rendered` is called with their output, if set.
+    """
+
+    template_extensions = (".html", ".htm", ".xhtml")
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(minify_parser=None, minify_rendered=None)
+
+        if not getattr(environment.template_class, "reports_rendered", False):
+            environment.template_class = get_reporting_template_class(
+                environment.template_class
+            )
+
+    def should_minify(self, name):
+        """Check if the template source should be minified.
+
+        Parameters
+        ----------
+        name: str
+            name of the template.
+
+        Returns
+        -------
+        bool
+            True if the template is an html one, and the environment has no
+            line statements or comments, which depend on the source new lines.
+        """
+        environment = self.environment
+
+        return bool(
+            environment.minify_parser
+            and name
+            and name.lower().endswith(self.template_extensions)
+            and not environment.line_statement_prefix
+            and not environment.line_comment_prefix
+        )
+
+    def preprocess(self, source, name, filename=None):
+        if not self.should_minify(name):
+            return source
+
+        environment = self.environment
+        regex = get_template_syntax_regex(
+            (environment.block_start_string, environment.block_end_string),
+            (environment.variable_start_string, environment.variable_end_string),
+            (environment.comment_start_string, environment.comment_end_string),
+        )
+        marker = "minify{0}_".format(uuid4().hex)
+        syntax = []
+
+        def replace_syntax(match):
+            syntax.append(match.group(0))
+            return "{0}{1}_".format(marker, len(syntax) - 1)
+
+        content = regex.sub(replace_syntax, source)
+        minified = environment.minify_parser.minify(content, "html")
+
+        return compile_re(r"{0}(\d+)_".format(marker)).sub(
+            lambda match: syntax[int(match.group(1))], minified
+        )
@@ -1,10 +1,27 @@
-from re import DOTALL
+from functools import lru_cache
+from gzip import compress as gzip_compress
+from re import DOTALL, IGNORECASE
 from re import compile as compile_re
-from re import sub
-from sys import maxsize
+from re import error as RegexError
+from re import search, sub
+from sys import getsizeof, maxsize
 
 from xxhash import xxh32, xxh64
 
+try:
+    import brotli
+except Exception:
+    brotli = None
+
+COMPLETE_HTML_CONSTRUCT = compile_re(
+    r"<!--.*?-->"
+    r"|<(script|style|pre|textarea)\b[^>]*>.*?</\1\s*>"
+    r"|<(?!!--|(?:script|style|pre|textarea)\b)[^>]*>",
+    DOTALL | IGNORECASE,
+)
+
+VOLATILE_PLACEHOLDER = compile_re(r"__flask_minify_volatile_(\d+)__")
+
 
 def is_empty(content):
     """Check if the content is truly empty.
@@ -91,6 +108,184 @@ def get_tag_contents(html, tag, script_types):
     )
 
 
+@lru_cache(maxsize=8)
+def get_tags_regex(tags):
+    return compile_re(r"(<({0})[^>]*>)(.*?)</\2>".format("|".join(tags)), DOTALL)
+
+
+def replace_tag_contents(html, tags, script_types, replace):
+    """Replace html tags contents in a single pass.
+
+    Parameters
+    ----------
+        html: string
+            html flask response content.
+        tags: tuple
+            tags to replace their content.
+        script_types: list
+            list of script types to limit js minification to.
+        replace: callable
+            called with the tag content and tag, to get its replacement.
+
+    Returns
+    -------
+        String of html with the tags contents replaced.
+    """
+    parts = []
+    end = 0
+
+    for block in get_tags_regex(tags).finditer(html):
+        tag, content = block.group(2), block.group(3)
+
+        if is_valid_tag_content(tag, block.group(1), content, script_types):
+            parts.append(html[end : block.start(3)])
+            parts.append(replace(content, tag))
+            end = block.end(3)
+
+    parts.append(html[end:])
+
+    return "".join(parts)
+
+
+def mask_volatile_values(content, patterns):
+    """Swap the volatile values of the content with placeholders.
+
+    Parameters
+    ----------
+        content: str
+            content to mask the volatile values of.
+        patterns: list
+            regex patterns of the volatile values, if a pattern has groups
+            only its first group is masked.
+
+    Returns
+    -------
+        Tuple of the masked content and the list of volatile values.
+    """
+    values = []
+
+    def mask(match):
+        group = 1 if match.re.groups else 0
+        start, end = (
+            match.start(group) - match.start(),
+            match.end(group) - match.start(),
+        )
+        values.append(match.group(group))
+        placeholder = "__flask_minify_volatile_{0}__".format(len(values) - 1)
+
+        return match.group(0)[:start] + placeholder + match.group(0)[end:]
+
+    for pattern in patterns:
+        content = compile_re(pattern).sub(mask, content)
+
+    return content, values
+
+
+def unmask_volatile_values(content, values):
+    """Put the volatile values back in place of their placeholders.
+
+    Parameters
+    ----------
+        content: str
+            content masked with `mask_volatile_values`.
+        values: list
+            volatile values to put back.
+
+    Returns
+    -------
+        String of the content with its volatile values.
+    """
+    return VOLATILE_PLACEHOLDER.sub(lambda m: values[int(m.group(1))], content)
+
+
+def get_complete_html_end(html):
+    """Get the end of the html content which can be minified on its own.
+
+    Parameters
+    ----------
+        html: string
+            partial html content, such as the chunks received so far.
+
+    Returns
+    -------
+        Integer index right after the last complete tag, comment or
+        script, style, pre and textarea block, 0 if there's none.
+    """
+    end = 0
+    start = html.find("<")
+
+    while start != -1:
+        construct = COMPLETE_HTML_CONSTRUCT.match(html, start)
+
+        if not construct:
+            break
+
+        end = construct.end()
+        start = html.find("<", end)
+
+    return end
+
+
+def get_patterns_regex(patterns):
+    """Compile the patterns, joined into a single alternation.
+
+    Parameters
+    ----------
+        patterns: list
+            regex patterns or strings.
+
+    Returns
+    -------
+        Compiled regex matching any of the patterns, or None if they can't be
+        joined, such as with back references, inline flags, which would apply
+        to all the patterns before Python 3.11, or compiled patterns.
+    """
+    not_joinable = r"\\[1-9]|\(\?[aiLmsux-]"
+
+    if any(not isinstance(p, str) or search(not_joinable, p) for p in patterns):
+        return None
+
+    try:
+        return compile_re("|".join("(?:{0})".format(p) for p in patterns))
+    except RegexError:
+        return None
+
+
+class EndpointMatcher:
+    """Matches endpoints against patterns compiled once, memoizing the
+    decision per endpoint.
+
+    Parameters
+    ----------
+        patterns: list
+            regex patterns or strings to match endpoints.
+    """
+
+    memo_limit = 1024
+
+    def __init__(self, patterns):
+        self.patterns = patterns[:]
+        self.regex = get_patterns_regex(patterns) if patterns else None
+        self.memo = {}
+
+    def search(self, endpoint):
+        if self.regex is not None:
+            return self.regex.search(endpoint) is not None
+
+        return any(compile_re(p).search(endpoint) for p in self.patterns)
+
+    def __call__(self, endpoint):
+        matches = self.memo.get(endpoint)
+
+        if matches is None:
+            if len(self.memo) >= self.memo_limit:
+                self.memo.clear()
+
+            matches = self.memo[endpoint] = self.search(endpoint)
+
+        return matches
+
+
 def does_content_type_match(response):
     """Check if Flask response of content-type match HTML, CSS\\LESS or JS.
 
@@ -114,3 +309,77 @@ def does_content_type_match(response):
 def get_optimized_hashing():
     """Gets optimized hashing module based on cpu architecture"""
     return xxh64 if maxsize > 2**32 else xxh32
+
+
+def get_size(*objects):
+    """Get the approximate memory footprint of the given objects.
+
+    Parameters
+    ----------
+        objects: any
+            objects to measure, containers are measured with their items.
+
+    Returns
+    -------
+        Integer size in bytes.
+    """
+    size = 0
+
+    for obj in objects:
+        size += getsizeof(obj)
+
+        if isinstance(obj, str) and hasattr(obj, "__dict__"):
+            size += get_size(obj.__dict__)
+        elif isinstance(obj, dict):
+            size += get_size(*obj.keys(), *obj.values())
+        elif isinstance(obj, (list, tuple)):
+            size += get_size(*obj)
+
+    return size
+
+
+def get_static_folders(app):
+    """Get the static folders of the Flask app and its blueprints.
+
+    Parameters
+    ----------
+        app: Flask app
+            app to get the static folders of.
+
+    Returns
+    -------
+        Dict of static endpoints and their folders paths.
+    """
+    folders = {}
+
+    if app.has_static_folder:
+        folders["static"] = app.static_folder
+
+    for name, blueprint in app.blueprints.items():
+        if blueprint.has_static_folder:
+            folders["{0}.static".format(name)] = blueprint.static_folder
+
+    return folders
+
+
+def get_compressed_encodings(content):
+    """Compress the content with the supported content encodings.
+
+    Parameters
+    ----------
+        content: str
+            content to compress.
+
+    Returns
+    -------
+        Dict of content encodings and the compressed content bytes.
+    """
+    data = content.encode("utf-8")
+    encodings = {}
+
+    if brotli:
+        encodings["br"] = brotli.compress(data)
+
+    encodings["gzip"] = gzip_compress(data, mtime=0)
+
+    return encodings
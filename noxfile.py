@@ -22,6 +22,16 @@ def test(session: nox.Session):
     session.run("python", "-m", "bandit", "-c", "bandit.yml", "-r", ".")
 
 
+@nox.session
+def benchmark(session: nox.Session):
+    session.install("-r", test_req_path)
+    session.install("-e", ".")
+
+    for module in sorted(os.listdir(os.path.join(basedir, "benchmarks"))):
+        if module.endswith(".py") and not module.startswith("_"):
+            session.run("python", "-m", f"benchmarks.{module[:-3]}")
+
+
 @nox.session
 def lint(session: nox.Session):
     session.install("-r", test_req_path)
@@ -2,7 +2,11 @@ from os import path
 
 from setuptools import setup
 
-optional_requirements = {"go": 'tdewolff-minify>=2.20.34; platform_system == "Linux"'}
+optional_requirements = {
+    "go": 'tdewolff-minify>=2.20.34; platform_system == "Linux"',
+    "redis": "redis",
+    "brotli": "brotli",
+}
 basedir = path.abspath(path.dirname(__file__))
 long_description = ""
 requirements = []
@@ -158,3 +158,41 @@ MINIFIED_HTML_EMBEDDED_TAGS_GO = bytes(
 )
 
 COMPILED_LESS_RAW = "body {\n color: red;\n}"
+
+HTML_STREAMED = HTML.replace("</html>", f"{JS}{LESS}</html>")
+
+MINIFIED_HTML_STREAMED = (
+    b'<html><body><h1> HTML </h1></body><script>["J","S"].reduce(function(a,r)'
+    b"{return a+r})</script><style>body{color:red;}</style></html>"
+)
+
+HTML_TEMPLATE = """<html>
+    <body>
+        {# comment #}
+        <h1 class="{{ cls }}">  {{ title }}  </h1>
+        {% raw %}  {{ raw }}  {% endraw %}
+        <script>
+            var data  =  {{ data|tojson }};
+        </script>
+    </body>
+</html>"""
+
+MINIFIED_HTML_TEMPLATE = (
+    '<html><body> {# comment #} <h1 class="{{ cls }}"> {{ title }} </h1> '
+    "{% raw %}  {{ raw }}  {% endraw %} <script>var data={{ data|tojson }};"
+    "</script></body></html>"
+)
+
+HTML_VOLATILE = """<html>
+    <body>
+        <input type="hidden" name="csrf_token" value="{0}">
+        <script nonce="{0}">
+            var token  =  "{0}";
+        </script>
+    </body>
+</html>"""
+
+MINIFIED_HTML_VOLATILE = (
+    '<html><body><input type="hidden" name="csrf_token" value="{0}">'
+    '<script nonce="{0}">var token="{0}";</script></body></html>'
+)
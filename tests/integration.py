@@ -1,11 +1,20 @@
+import gzip
+import json
 import os
+from threading import current_thread
+from time import sleep
+from unittest import mock
 
 import pytest
-from flask import send_from_directory
+from flask import Blueprint, Flask, render_template, send_from_directory
+
+from flask_minify import minify
+from flask_minify.parsers import Lesscpy
 
 from .constants import (
     FALSE_LESS,
     HTML,
+    HTML_TEMPLATE,
     JS,
     JS_RAW,
     JS_WITH_TYPE,
@@ -13,6 +22,9 @@ from .constants import (
     LESS_RAW,
     MINIFIED_HTML,
     MINIFIED_HTML_EMBEDDED_TAGS,
+    MINIFIED_HTML_STREAMED,
+    MINIFIED_HTML_TEMPLATE,
+    MINIFIED_HTML_VOLATILE,
     MINIFIED_JS,
     MINIFIED_JS_RAW,
     MINIFIED_JS_WITH_TYPE,
@@ -32,7 +44,11 @@ def client():
     store_minify.js = True
     store_minify.bypass = ["html_embedded"]
     store_minify.bypass_caching = []
+    store_minify.volatile = []
     store_minify.passive = False
+    store_minify.compress = False
+    store_minify.etag = False
+    store_minify.stream = False
     store_minify.parser.runtime_options["html"]["minify_inline"] = {
         "script": True,
         "style": True,
@@ -299,3 +315,529 @@ def test_unicode_endpoint(client):
 
     assert resp.status == "200 OK"
     assert resp.data.decode("utf-8") == "–"
+
+
+@pytest.fixture
+def static_app(tmp_path):
+    static_folder = tmp_path / "static"
+    blueprint_folder = tmp_path / "blueprint"
+    static_folder.mkdir()
+    blueprint_folder.mkdir()
+    (static_folder / "test.js").write_text(JS_RAW)
+    (static_folder / "test.less").write_text(LESS_RAW)
+    (static_folder / "test.min.js").write_text(JS_RAW)
+    (static_folder / "test.txt").write_text(JS_RAW)
+    (blueprint_folder / "test.js").write_text(JS_RAW)
+
+    static_app = Flask(__name__, static_folder=str(static_folder))
+    blueprint = Blueprint("bp", __name__, static_folder=str(blueprint_folder))
+    static_app.register_blueprint(blueprint, url_prefix="/bp")
+    ext = minify(static_app, go=False, static_manifest=True)
+    ext.parser.parsers["style"] = Lesscpy
+
+    return static_app, static_folder, blueprint_folder
+
+
+def test_build_static_files(static_app):
+    """test minifying static files ahead of time"""
+    static_app, static_folder, blueprint_folder = static_app
+    result = static_app.test_cli_runner().invoke(args=["minify", "build", "-w", "1"])
+    manifest = json.loads((static_folder / "minify-manifest.json").read_text())
+
+    assert result.exit_code == 0
+    assert manifest == {"test.js": "test.min.js", "test.less": "test.min.less"}
+    assert (static_folder / "test.min.js").read_bytes() == MINIFIED_JS_RAW
+    assert (static_folder / "test.min.less").read_bytes() == MINIFIED_LESS_RAW
+    assert (blueprint_folder / "test.min.js").read_bytes() == MINIFIED_JS_RAW
+
+
+def test_build_static_files_bypassed(static_app):
+    """test bypassed static files not minified ahead of time"""
+    static_app, static_folder, _ = static_app
+    static_app.extensions["minify"].bypass = [r"\.less$"]
+    static_app.test_cli_runner().invoke(args=["minify", "build", "-w", "1"])
+    manifest = json.loads((static_folder / "minify-manifest.json").read_text())
+
+    assert manifest == {"test.js": "test.min.js"}
+
+
+def test_serve_built_static_files(static_app):
+    """test serving static files minified ahead of time"""
+    static_app, static_folder, blueprint_folder = static_app
+    static_app.test_cli_runner().invoke(args=["minify", "build", "-w", "1"])
+    ext = static_app.extensions["minify"]
+    (static_folder / "test.min.js").write_text("built")
+    (blueprint_folder / "test.min.js").write_text("built blueprint")
+
+    with mock.patch.object(ext.parser, "minify") as parser_minify:
+        with static_app.test_client() as client:
+            resp = client.get("/static/test.js")
+            resp_bp = client.get("/bp/blueprint/test.js")
+
+    assert resp.data == b"built"
+    assert resp.mimetype == "text/javascript"
+    assert resp_bp.data == b"built blueprint"
+    assert parser_minify.call_count == 0
+
+
+def test_serve_static_files_minified_once(static_app, tmp_path):
+    """test serving static files minified once into the static cache directory"""
+    static_app, static_folder, _ = static_app
+    ext = static_app.extensions["minify"]
+    ext.static_cache_dir = str(tmp_path / "minified")
+
+    with static_app.test_client() as client:
+        resp = client.get("/static/test.js")
+
+        with mock.patch.object(ext.parser, "minify") as parser_minify:
+            cached_resp = client.get("/static/test.js")
+            partial_resp = client.get("/static/test.js", headers={"Range": "bytes=0-6"})
+            not_modified_resp = client.get(
+                "/static/test.js",
+                headers={"If-Modified-Since": resp.headers["Last-Modified"]},
+            )
+
+    assert resp.data == cached_resp.data == MINIFIED_JS_RAW
+    assert resp.mimetype == "text/javascript"
+    assert partial_resp.status_code == 206
+    assert partial_resp.data == MINIFIED_JS_RAW[:7]
+    assert not_modified_resp.status_code == 304
+    assert parser_minify.call_count == 0
+    assert len(os.listdir(ext.static_cache_dir)) == 1
+
+
+def test_serve_static_files_minified_again_when_modified(static_app, tmp_path):
+    """test static files minified again into the static cache once modified"""
+    static_app, static_folder, _ = static_app
+    ext = static_app.extensions["minify"]
+    ext.static_cache_dir = str(tmp_path / "minified")
+
+    with static_app.test_client() as client:
+        client.get("/static/test.js")
+        (static_folder / "test.js").write_text(JS_RAW * 2)
+        resp = client.get("/static/test.js")
+        not_found_resp = client.get("/static/missing.js")
+
+    assert resp.data == MINIFIED_JS_RAW * 2
+    assert not_found_resp.status_code == 404
+    assert len(os.listdir(ext.static_cache_dir)) == 1
+
+
+def test_stale_static_files_removed_by_another_worker(static_app, tmp_path):
+    """test serving modified static files, if their stale version is gone"""
+    static_app, static_folder, _ = static_app
+    ext = static_app.extensions["minify"]
+    ext.static_cache_dir = str(tmp_path / "minified")
+
+    with static_app.test_client() as client:
+        client.get("/static/test.js")
+        (static_folder / "test.js").write_text(JS_RAW * 2)
+
+        with mock.patch("os.remove", side_effect=FileNotFoundError):
+            resp = client.get("/static/test.js")
+
+    assert resp.status_code == 200
+    assert resp.data == MINIFIED_JS_RAW * 2
+
+
+def test_static_files_cached_without_reading(static_app):
+    """test cached static files restored without reading them"""
+    static_app, static_folder, _ = static_app
+    ext = static_app.extensions["minify"]
+    ext.cache.limit = 10
+
+    with static_app.test_client() as client:
+        resp = client.get("/static/test.js")
+
+        with mock.patch.object(ext, "get_content") as get_content:
+            cached_resp = client.get("/static/test.js")
+
+    assert resp.data == cached_resp.data == MINIFIED_JS_RAW
+    assert get_content.call_count == 0
+
+
+def test_static_files_partial_response_not_cached_as_file(static_app):
+    """test partial static file responses not cached in place of the file"""
+    static_app, static_folder, _ = static_app
+    static_app.extensions["minify"].cache.limit = 10
+
+    with static_app.test_client() as client:
+        partial_resp = client.get("/static/test.js", headers={"Range": "bytes=0-5"})
+        resp = client.get("/static/test.js")
+
+    assert partial_resp.status_code == 206
+    assert resp.status_code == 200
+    assert resp.data == MINIFIED_JS_RAW
+
+
+def test_static_files_cache_invalidated_when_modified(static_app):
+    """test cached static files invalidated once modified"""
+    static_app, static_folder, _ = static_app
+    ext = static_app.extensions["minify"]
+    ext.cache.limit = 10
+
+    with static_app.test_client() as client:
+        client.get("/static/test.js")
+        (static_folder / "test.js").write_text(JS_RAW * 2)
+
+        with mock.patch.object(
+            ext, "invalidate_static", wraps=ext.invalidate_static
+        ) as invalidate_static:
+            resp = client.get("/static/test.js")
+
+    assert resp.data == MINIFIED_JS_RAW * 2
+    assert invalidate_static.call_count == 1
+    assert list(ext.cache._cache["/static/test.js"].values()) == [resp.data.decode()]
+
+
+def test_compressed_response(client):
+    """test serving cached compressed minified response"""
+    store_minify.compress = True
+    headers = {"Accept-Encoding": "gzip, deflate"}
+    resp = client.get("/html", headers=headers)
+
+    with mock.patch.object(store_minify.parser, "minify") as parser_minify:
+        cached_resp = client.get("/html", headers=headers)
+
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in resp.headers["Vary"]
+    assert gzip.decompress(resp.data) == MINIFIED_HTML
+    assert cached_resp.data == resp.data
+    assert parser_minify.call_count == 0
+
+
+def test_compressed_response_not_accepted(client):
+    """test serving minified response to clients not accepting compression"""
+    store_minify.compress = True
+    resp = client.get("/html", headers={"Accept-Encoding": "gzip;q=0"})
+
+    assert "Content-Encoding" not in resp.headers
+    assert "Accept-Encoding" in resp.headers["Vary"]
+    assert resp.data == MINIFIED_HTML
+
+
+def test_brotli_compressed_response(client):
+    """test serving brotli compressed response when available and preferred"""
+    store_minify.compress = True
+    headers = {"Accept-Encoding": "gzip, br"}
+
+    with mock.patch("flask_minify.utils.brotli") as brotli:
+        brotli.compress.return_value = b"brotli"
+        resp = client.get("/html", headers=headers)
+
+    assert resp.headers["Content-Encoding"] == "br"
+    assert resp.data == b"brotli"
+
+
+def test_etag_not_modified(client):
+    """test answering requests matching the minified response ETag with 304"""
+    store_minify.etag = True
+    resp = client.get("/html")
+    etag = resp.headers["ETag"]
+
+    with mock.patch.object(store_minify, "hashing") as hashing:
+        not_modified_resp = client.get("/html", headers={"If-None-Match": etag})
+
+    modified_resp = client.get("/html", headers={"If-None-Match": '"outdated"'})
+
+    assert resp.data == modified_resp.data == MINIFIED_HTML
+    assert etag == '"{0}"'.format(store_minify.hashing(MINIFIED_HTML).hexdigest())
+    assert not_modified_resp.status_code == 304
+    assert not_modified_resp.data == b""
+    assert modified_resp.status_code == 200
+    assert hashing.call_count == 0
+
+
+def test_etag_differs_between_content_encodings(client):
+    """test compressed responses having their own strong ETag"""
+    store_minify.etag = True
+    store_minify.compress = True
+    etag = client.get("/html").headers["ETag"]
+    gzip_etag = client.get("/html", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+    not_modified_resp = client.get(
+        "/html", headers={"Accept-Encoding": "gzip", "If-None-Match": gzip_etag}
+    )
+
+    assert gzip_etag == etag[:-1] + '-gzip"'
+    assert not_modified_resp.status_code == 304
+
+
+def test_streamed_response(client):
+    """test minifying streamed response chunk by chunk"""
+    store_minify.stream = True
+    resp = client.get("/html_streamed")
+
+    assert "Content-Length" not in resp.headers
+    assert resp.data == MINIFIED_HTML_STREAMED
+
+
+def test_streamed_response_buffered(client):
+    """test minifying streamed response as a whole if streaming disabled"""
+    resp = client.get("/html_streamed")
+
+    assert resp.headers["Content-Length"] == str(len(MINIFIED_HTML_STREAMED))
+    assert resp.data == MINIFIED_HTML_STREAMED
+
+
+def test_endpoint_resolved_once_per_request(client):
+    """test resolving the endpoint once, without pushing app contexts"""
+    store_minify.bypass = ["other"]
+    store_minify.bypass_caching = ["another"]
+
+    with mock.patch.object(app, "app_context", wraps=app.app_context) as context:
+        assert client.get("/html").data == MINIFIED_HTML
+        assert client.get("/html").data == MINIFIED_HTML
+
+    assert context.call_count == 2  # pushed by the requests themselves
+    assert "html" in store_minify.cache._cache
+
+
+def test_volatile_values_cached_once(client):
+    """test responses differing only by volatile values hitting the cache"""
+    store_minify.cache.limit = 10
+    store_minify.volatile = [r'(?:value|nonce)="(\w+)"', r'token\s*=\s*"(\w+)"']
+    hits = store_minify.cache.hits
+    responses = [client.get("/html_volatile").data.decode("utf-8") for _ in range(5)]
+
+    assert len(store_minify.cache._cache["html_volatile"]) == 1
+    assert store_minify.cache.hits - hits == 4
+    for resp in responses:
+        token = resp.split('nonce="')[1].split('"')[0]
+        assert resp == MINIFIED_HTML_VOLATILE.format(token)
+    assert len(set(responses)) == 5
+
+
+def test_volatile_values_not_cached_without_patterns(client):
+    """test responses differing by volatile values missing the cache"""
+    store_minify.cache.limit = 10
+    hits = store_minify.cache.hits
+    [client.get("/html_volatile") for _ in range(5)]
+
+    assert store_minify.cache.hits == hits
+
+
+@pytest.fixture
+def workers_minify():
+    workers_minify = minify(app=None, go=False, workers=1, time_budget=0.05)
+    slow_minify = workers_minify.parser.minify
+    workers_minify.parser.minify = lambda *args: sleep(0.2) or slow_minify(*args)
+
+    with app.test_request_context("/html"):
+        yield workers_minify
+
+    workers_minify.executor.shutdown()
+
+
+def test_workers_minify_in_time(workers_minify):
+    """test serving the minified response if minified within the time budget"""
+    workers_minify.time_budget = 1
+
+    assert workers_minify.get_minified_or_cached(HTML, "html") == MINIFIED_HTML.decode()
+
+
+def test_workers_exceeding_time_budget(workers_minify):
+    """test serving the response as it is, and caching it in the background"""
+    assert workers_minify.get_minified_or_cached(HTML, "html") == HTML
+
+    workers_minify.executor.submit(lambda: None).result()
+
+    key = workers_minify.get_cache_key(HTML, "html")
+
+    assert workers_minify.cache.get_or_set(key, None) == MINIFIED_HTML.decode()
+
+
+def test_workers_without_time_budget(workers_minify):
+    """test serving the response as it is right away, with a zero time budget"""
+    workers_minify.time_budget = 0
+
+    assert workers_minify.get_minified_or_cached(HTML, "html") == HTML
+
+
+def test_lazy_minify(workers_minify):
+    """test serving the response right away, and caching it in the background"""
+    workers_minify.workers = 0
+    workers_minify.lazy = True
+    workers_minify.time_budget = 10
+
+    assert workers_minify.get_minified_or_cached(HTML, "html") == HTML
+
+    workers_minify.executor.submit(lambda: None).result()
+
+    assert workers_minify.get_minified_or_cached(HTML, "html") == MINIFIED_HTML.decode()
+
+
+def test_lazy_minify_bypassing_caching(workers_minify):
+    """test minifying the response right away, if its caching is bypassed"""
+    workers_minify.lazy = True
+    workers_minify.time_budget = 10
+    workers_minify.bypass_caching = ["html"]
+
+    assert workers_minify.get_minified_or_cached(HTML, "html") == MINIFIED_HTML.decode()
+
+    workers_minify.workers = 0
+
+    with mock.patch.object(workers_minify, "get_minified_in_time") as in_time:
+        minified = workers_minify.get_minified_or_cached(HTML, "html")
+
+    assert minified == MINIFIED_HTML.decode()
+    assert in_time.call_count == 0
+
+
+def test_lazy_minify_without_caching(workers_minify):
+    """test minifying the response right away, if caching is disabled"""
+    workers_minify.workers = 0
+    workers_minify.lazy = True
+    workers_minify.cache.limit = 0
+
+    with mock.patch.object(workers_minify, "get_minified_in_time") as in_time:
+        responses = [
+            workers_minify.get_minified_or_cached(HTML, "html") for _ in range(2)
+        ]
+
+    assert responses == [MINIFIED_HTML.decode()] * 2
+    assert in_time.call_count == 0
+
+
+def test_lazy_minify_without_replaying_request_context():
+    """test caching lazily minified responses without tearing their request down
+    again in the worker thread"""
+    lazy_app = Flask(__name__)
+    ext = minify(lazy_app, go=False, lazy=True)
+    slow_minify = ext.parser.minify
+    ext.parser.minify = lambda *args: sleep(0.05) or slow_minify(*args)
+    teardowns = []
+    lazy_app.teardown_request(lambda _: teardowns.append(current_thread().name))
+
+    @lazy_app.route("/html")
+    def html():
+        return HTML
+
+    client = lazy_app.test_client()
+
+    try:
+        resp = client.get("/html")
+        ext.executor.submit(lambda: None).result()
+        cached_resp = client.get("/html")
+    finally:
+        ext.executor.shutdown()
+
+    assert resp.data == HTML.encode()
+    assert cached_resp.data == MINIFIED_HTML
+    assert list(ext.cache._cache) == ["html"]
+    assert teardowns == [current_thread().name] * 2
+
+
+def test_workers_queue_full(workers_minify):
+    """test serving the response as it is, if no worker is free"""
+    workers_minify.executor.submit(sleep, 0.1)
+    workers_minify._executor_slots.acquire()
+
+    assert workers_minify.get_minified_or_cached(HTML, "html") == HTML
+
+
+def test_workers_static_files_exceeding_time_budget(static_app):
+    """test serving static files as they are, within the time budget"""
+    static_app, static_folder, _ = static_app
+    ext = static_app.extensions["minify"]
+    ext.cache.limit = 10
+    ext.workers = 1
+    ext.time_budget = 0.01
+    slow_minify = ext.parser.minify
+    ext.parser.minify = lambda *args: sleep(0.2) or slow_minify(*args)
+
+    try:
+        with static_app.test_client() as client:
+            resp = client.get("/static/test.js")
+            ext.executor.submit(lambda: None).result()
+            cached_resp = client.get("/static/test.js")
+    finally:
+        ext.executor.shutdown()
+
+    assert resp.data.decode() == JS_RAW
+    assert cached_resp.data == MINIFIED_JS_RAW
+
+
+def test_lazy_minify_static_files(static_app):
+    """test serving static files right away, and caching them in the background"""
+    static_app, static_folder, _ = static_app
+    ext = static_app.extensions["minify"]
+    ext.cache.limit = 10
+    ext.lazy = True
+    slow_minify = ext.parser.minify
+    ext.parser.minify = lambda *args: sleep(0.05) or slow_minify(*args)
+
+    try:
+        with static_app.test_client() as client:
+            resp = client.get("/static/test.js")
+            ext.executor.submit(lambda: None).result()
+
+            with mock.patch.object(ext, "get_content") as get_content:
+                cached_resp = client.get("/static/test.js")
+    finally:
+        ext.executor.shutdown()
+
+    assert resp.data.decode() == JS_RAW
+    assert cached_resp.data == MINIFIED_JS_RAW
+    assert get_content.call_count == 0
+
+
+def test_worker_processes_warmed_up_on_first_request():
+    """test starting the worker processes in the background once"""
+    warm_app = Flask(__name__)
+    ext = minify(warm_app, go=False, processes=2)
+
+    @warm_app.route("/html")
+    def html():
+        return HTML
+
+    client = warm_app.test_client()
+
+    with mock.patch("flask_minify.main.Thread") as thread:
+        responses = [client.get("/html") for _ in range(2)]
+
+    assert [resp.data for resp in responses] == [MINIFIED_HTML] * 2
+    assert thread.call_count == 1
+    assert thread.call_args.kwargs["target"] == ext.parser.warm_up
+    assert thread.return_value.start.call_count == 1
+
+
+@pytest.fixture
+def templates_app(tmp_path):
+    (tmp_path / "index.html").write_text(HTML_TEMPLATE)
+    templates_app = Flask(__name__, template_folder=str(tmp_path))
+    ext = minify(templates_app, go=False, templates=True)
+
+    @templates_app.route("/")
+    def index():
+        return render_template("index.html", cls="c", title="T", data=[1])
+
+    @templates_app.route("/mail")
+    def mail():
+        render_template("index.html", cls="c", title="T", data=[1])
+
+        return HTML
+
+    return templates_app, ext
+
+
+def test_templates_minified_once(templates_app):
+    """test minifying templates when compiled, instead of their responses"""
+    templates_app, ext = templates_app
+    expected = templates_app.jinja_env.from_string(MINIFIED_HTML_TEMPLATE).render(
+        cls="c", title="T", data=[1]
+    )
+
+    with mock.patch.object(ext.parser, "minify", wraps=ext.parser.minify) as minify:
+        responses = [templates_app.test_client().get("/") for _ in range(3)]
+
+    assert minify.call_count == 2  # the template html and its script block
+    for resp in responses:
+        assert resp.data.decode("utf-8") == expected
+
+
+def test_templates_rendered_aside_not_bypassing_response(templates_app):
+    """test minifying responses that aren't the minified templates output"""
+    templates_app, ext = templates_app
+    resp = templates_app.test_client().get("/mail")
+
+    assert resp.data == MINIFIED_HTML
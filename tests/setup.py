@@ -1,4 +1,6 @@
-from flask import Flask
+from uuid import uuid4
+
+from flask import Flask, Response
 
 from flask_minify import minify
 from flask_minify import parsers as minify_parsers
@@ -11,6 +13,8 @@ from .constants import (
     HTML,
     HTML_CONDITIONAL_COMMENTS,
     HTML_EMBEDDED_TAGS,
+    HTML_STREAMED,
+    HTML_VOLATILE,
     JS,
     JS_WITH_TYPE,
     LESS,
@@ -95,6 +99,16 @@ def create_app(go=True):
     def unicode_endpoint():
         return "–"
 
+    @app.route("/html_streamed")
+    def html_streamed():
+        chunks = (HTML_STREAMED[i : i + 7] for i in range(0, len(HTML_STREAMED), 7))
+
+        return Response(chunks, mimetype="text/html")
+
+    @app.route("/html_volatile")
+    def html_volatile():
+        return HTML_VOLATILE.format(uuid4().hex)
+
     @app.route("/conditional-comments")
     def conditional_comments():
         return HTML_CONDITIONAL_COMMENTS
@@ -1,21 +1,114 @@
+import os
+import pickle
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, wait
+from fnmatch import fnmatch
+from multiprocessing import Pool
+from tempfile import TemporaryDirectory
+from threading import Barrier, Thread, local
+from time import sleep
 from unittest import mock
+from uuid import uuid4
 
 import pytest
+from jinja2 import DictLoader, Environment
 
 from flask_minify import minify, parsers
-from flask_minify.cache import MemoryCache
+from flask_minify.cache import (
+    DiskCache,
+    MemoryCache,
+    MinifiedContent,
+    RedisCache,
+    SharedMemoryCache,
+    TieredCache,
+    get_private_dir,
+)
+from flask_minify.decorators import minify as decorator
 from flask_minify.exceptions import FlaskMinifyException
-from flask_minify.utils import does_content_type_match, is_empty
+from flask_minify.templates import MinifyTemplates
+from flask_minify.utils import (
+    EndpointMatcher,
+    does_content_type_match,
+    get_size,
+    is_empty,
+    mask_volatile_values,
+    unmask_volatile_values,
+)
 
 from .constants import (
     COMPILED_LESS_RAW,
     CSS_EDGE_CASES,
+    HTML,
+    HTML_EMBEDDED_TAGS,
+    HTML_TEMPLATE,
+    JS,
+    JS_RAW,
+    LESS,
     LESS_RAW,
     MINIFIED_CSS_EDGE_CASES,
+    MINIFIED_HTML,
+    MINIFIED_HTML_TEMPLATE,
+    MINIFIED_JS_RAW,
+    MINIFIED_LESS_RAW,
 )
 
 
 class TestUtils:
+    def test_get_size_of_minified_content_variants(self):
+        minified = MinifiedContent("minified")
+        minified.encodings = {"gzip": b"compressed"}
+
+        assert get_size(minified) > get_size("minified") + get_size(b"compressed")
+
+    def test_mask_volatile_values(self):
+        content = '<p nonce="a1">b2</p><i>c3</i>'
+        masked, values = mask_volatile_values(content, [r'nonce="(\w+)"', "c3"])
+
+        assert masked == (
+            '<p nonce="__flask_minify_volatile_0__">b2</p>'
+            "<i>__flask_minify_volatile_1__</i>"
+        )
+        assert values == ["a1", "c3"]
+        assert unmask_volatile_values(masked, values) == content
+
+    def test_endpoint_matcher(self):
+        matcher = EndpointMatcher([r"^bp\.", "static$"])
+
+        assert matcher.regex.pattern == r"(?:^bp\.)|(?:static$)"
+        assert matcher("bp.index") is True
+        assert matcher("other.static") is True
+        assert matcher("other.bp.index") is False
+        assert matcher.memo == {
+            "bp.index": True,
+            "other.static": True,
+            "other.bp.index": False,
+        }
+
+    def test_endpoint_matcher_memo_limit(self):
+        matcher = EndpointMatcher(["index"])
+        matcher.memo_limit = 2
+
+        for endpoint in ("a", "b", "index"):
+            matcher(endpoint)
+
+        assert matcher.memo == {"index": True}
+
+    def test_endpoint_matcher_patterns_not_joinable(self):
+        matcher = EndpointMatcher([r"(a)\1", "(?P<b>b)", "(?P<b>c)"])
+
+        assert matcher.regex is None
+        assert matcher("aa") is True
+        assert matcher("c") is True
+        assert matcher("a") is False
+        assert EndpointMatcher([])("index") is False
+
+    def test_endpoint_matcher_patterns_with_inline_flags(self):
+        matcher = EndpointMatcher(["(?i)static", "^Index$", "(?s:a.b)"])
+
+        assert matcher.regex is None
+        assert matcher("STATIC") is True
+        assert matcher("index") is False
+
     def test_is_empty(self):
         """Test is_empty check is correct"""
         assert is_empty("Not empty at all") is False
@@ -93,6 +186,55 @@ class TestMinifyRequest:
 
         assert (list(matches), exists) == ([], False)
 
+    def test_endpoint_matches_renewed_once_patterns_change(self):
+        ext = self.minify_defaults
+        ext.bypass = ["first"]
+
+        assert ext.get_endpoint_matches(ext.bypass, "first")[1] is True
+        assert ext.get_endpoint_matches(ext.bypass, "second")[1] is False
+
+        ext.bypass.append("second")
+        matches, exists = ext.get_endpoint_matches(ext.bypass, "second")
+
+        assert exists is True
+        assert [m.pattern for m in matches] == ["second"]
+
+        ext.bypass = []
+
+        assert ext.get_endpoint_matches(ext.bypass, "first")[1] is False
+
+    def test_workers_pool_created_once_by_concurrent_requests(self):
+        ext = self.minify_defaults
+        barrier = Barrier(8)
+
+        def create_pool(*args, **kwargs):
+            sleep(0.05)
+            return mock.Mock()
+
+        def get_executor(_):
+            barrier.wait()
+            return ext.executor, ext._executor_slots
+
+        with mock.patch(
+            "flask_minify.main.ThreadPoolExecutor", side_effect=create_pool
+        ) as pool:
+            with ThreadPoolExecutor(8) as executor:
+                results = set(executor.map(get_executor, range(8)))
+
+        assert pool.call_count == 1
+        assert results == {(ext.executor, ext._executor_slots)}
+
+    def test_endpoint_stores_bounded_by_default(self):
+        ext = self.minify_defaults
+        ext.cache.store_key_getter = lambda: self.mock_request.path
+
+        for i in range(1010):
+            self.mock_request.path = f"/static/{i}.js"
+            ext.cache.get_or_set("content", lambda: MinifiedContent("x"))
+
+        assert len(ext.cache._cache) == 1000
+        assert next(iter(ext.cache._cache)) == "/static/10.js"
+
     def test_access_app_after_lazy_initialization(self):
         """"""
         self.mock_app = None
@@ -131,6 +273,180 @@ class TestParsers:
         with pytest.raises(FlaskMinifyException):
             parser.minify(LESS_RAW, "style")
 
+    def test_minify_stream_holds_back_incomplete_blocks(self):
+        parser = parsers.Parser(go=False)
+        parser.update_runtime_options(html=True, js=True)
+        chunks = iter(["<html><p>a</p><scr", "ipt>var a = ", "'</p>';</script>"])
+        stream = parser.minify_stream(chunks)
+
+        assert next(stream) == "<html><p>a</p>"
+        assert list(chunks) == ["ipt>var a = ", "'</p>';</script>"]
+
+    def test_minify_stream_matches_minify(self):
+        parser = parsers.Parser(go=False)
+        parser.update_runtime_options(html=True, js=True, cssless=True)
+        content = HTML_EMBEDDED_TAGS.encode("utf-8")
+        chunks = (content[i : i + 5] for i in range(0, len(content), 5))
+
+        assert "".join(parser.minify_stream(chunks)) == parser.minify(
+            HTML_EMBEDDED_TAGS, "html"
+        )
+
+    def test_inline_minify_only_replaces_tags_contents(self):
+        parser = parsers.Parser(go=False)
+        parser.update_runtime_options(js=True)
+        content = "<p>var a  =  1;</p><script>var a  =  1;</script>"
+
+        assert parser.minify(content, "html") == (
+            "<p>var a  =  1;</p><script>var a=1;</script>"
+        )
+
+    def test_inline_blocks_cached_across_pages(self):
+        parser = parsers.Parser(go=False, inline_caching_limit=10)
+        parser.update_runtime_options(js=True, cssless=True)
+        pages = [f"<p>{i}</p>{JS}{LESS}" for i in range(3)]
+
+        with mock.patch.object(parser, "minify", wraps=parser.minify) as minify:
+            minified = [minify(page, "html") for page in pages]
+
+        assert [c.args[1] for c in minify.call_args_list].count("script") == 1
+        assert [c.args[1] for c in minify.call_args_list].count("style") == 1
+        assert parser.inline_cache.hits == 4
+        assert minified[2] == minified[0].replace("<p>0</p>", "<p>2</p>")
+
+    def test_inline_blocks_cache_keyed_by_options(self):
+        parser = parsers.Parser(go=False, inline_caching_limit=10)
+        parser.update_runtime_options(js=True, script_types=["text/javascript"])
+        content = "<script type='text/javascript'>var a  =  1;</script>"
+
+        assert parser.minify(content, "html").endswith("var a=1;</script>")
+
+        parser.runtime_options["script"] = {"quote_chars": "'"}
+        parser.minify(content, "html")
+
+        assert parser.inline_cache.misses == 2
+
+    def test_parser_instance_reused_until_options_change(self):
+        parser = parsers.Parser(go=False)
+        parser.update_runtime_options(js=True)
+        content = "<script>var a  =  1;</script>"
+
+        with mock.patch.object(parsers.Html, "__init__", return_value=None) as init:
+            parser.minify(content, "html")
+            parser.minify(content, "html")
+
+            assert init.call_count == 1
+
+            parser.runtime_options["html"]["minify_inline"]["script"] = False
+
+            assert parser.minify(content, "html") == content
+            assert init.call_count == 2
+
+    def test_parser_instance_renewed_once_parser_changes(self):
+        parser = parsers.Parser(go=False)
+        parser.minify(LESS_RAW, "style")
+        parser.parsers["style"] = parsers.Lesscpy
+
+        assert parser.minify(LESS_RAW, "style") == MINIFIED_LESS_RAW.decode()
+
+    def test_options_key_renewed_before_publishing_prepared_parsers(self):
+        parser = parsers.Parser(go=False)
+        parser.get_cache_key("content", "html")
+        parser.update_runtime_options(html=True, js=True)
+        renewed = []
+
+        with mock.patch.object(
+            parsers.Parser,
+            "__setattr__",
+            lambda self, name, value: renewed.append(name)
+            or object.__setattr__(self, name, value),
+        ):
+            parser.get_cache_key("content", "html")
+
+        assert renewed == ["_options_key", "_prepared", "_prepared_for"]
+
+    def test_minify_in_worker_process(self):
+        options = {"go": False, "processes": 1, "process_min_size": 0}
+        parser = parsers.Parser({"style": parsers.Lesscpy}, **options)
+        parser.update_runtime_options(html=True, js=True, cssless=True)
+        expected = parsers.Parser(
+            {"style": parsers.Lesscpy}, go=False, runtime_options=parser.runtime_options
+        )
+
+        try:
+            assert parser.minify(HTML_EMBEDDED_TAGS, "html") == expected.minify(
+                HTML_EMBEDDED_TAGS, "html"
+            )
+
+            with pytest.raises(FlaskMinifyException):
+                parser.minify("body { color: red;; }", "style")
+        finally:
+            parser.executor.shutdown()
+
+    def test_warm_up_worker_processes(self):
+        parser = parsers.Parser(go=False, processes=2)
+
+        try:
+            wait(parser.warm_up())
+
+            assert len(parser.executor._processes) == 2
+        finally:
+            parser.executor.shutdown()
+
+        assert parsers.Parser(go=False).warm_up() == []
+
+    def test_minify_with_broken_process_pool(self):
+        options = {"go": False, "processes": 1, "process_min_size": 0}
+        parser = parsers.Parser(**options)
+        parser.minify(JS_RAW, "script")
+        broken_executor = parser.executor
+
+        for process in list(broken_executor._processes.values()):
+            process.kill()
+            process.join()
+
+        try:
+            assert parser.minify(JS_RAW, "script") == MINIFIED_JS_RAW.decode()
+            assert parser.minify(JS_RAW, "script") == MINIFIED_JS_RAW.decode()
+            assert parser.executor is not broken_executor
+        finally:
+            parser.executor.shutdown()
+
+    def test_process_pool_created_once_by_concurrent_threads(self):
+        parser = parsers.Parser(go=False, processes=1)
+        barrier = Barrier(8)
+
+        def create_pool(*args, **kwargs):
+            sleep(0.05)
+            return mock.Mock()
+
+        def get_executor(_):
+            barrier.wait()
+            return parser.executor
+
+        with mock.patch(
+            "flask_minify.parsers.ProcessPoolExecutor", side_effect=create_pool
+        ) as pool:
+            with ThreadPoolExecutor(8) as executor:
+                executors = set(executor.map(get_executor, range(8)))
+
+        assert pool.call_count == 1
+        assert executors == {parser.executor}
+
+    def test_pickled_parser_has_its_own_executor_lock(self):
+        parser = parsers.Parser(go=False, processes=1)
+        copy = pickle.loads(pickle.dumps(parser))
+
+        assert copy._executor is None
+        assert copy._executor_lock is not parser._executor_lock
+        assert copy._executor_lock.acquire(blocking=False)
+
+    def test_minify_small_content_in_current_process(self):
+        parser = parsers.Parser(go=False, processes=1)
+
+        assert parser.minify(JS_RAW, "script") == MINIFIED_JS_RAW.decode()
+        assert parser._executor is None
+
     def test_default_parsers_when_go_enabled_and_dependancy_missing(self):
         with mock.patch("flask_minify.parsers.minify_go", None):
             parser = parsers.Parser(go=True)
@@ -151,6 +467,86 @@ class TestParsers:
             with pytest.raises(FlaskMinifyException):
                 parsers.Parser(parsers=parsers.Parser._go_default_parsers, go=True)
 
+    @mock.patch("flask_minify.parsers.minify_go")
+    @mock.patch("flask_minify.parsers.go_config", new_callable=parsers.GoConfig)
+    def test_go_minifier_configured_once_options_change(self, go_config, minify_go):
+        parser = parsers.Parser(go=True)
+
+        for tag in ("html", "script", "style", "html"):
+            parser.minify("content", tag)
+
+        assert minify_go.config.call_count == 1
+        assert minify_go.config.call_args.args[0]["html-keep-comments"] is False
+
+        parser.runtime_options["html"] = {"html-keep-comments": True}
+        parser.minify("content", "script")
+
+        assert minify_go.config.call_count == 2
+        assert minify_go.config.call_args.args[0]["html-keep-comments"] is True
+
+    @mock.patch("flask_minify.parsers.minify_go")
+    @mock.patch("flask_minify.parsers.go_config", new_callable=parsers.GoConfig)
+    def test_go_minifier_options_unchanged_while_minifying(self, go_config, minify_go):
+        options = [{"html": {"html-keep-comments": bool(i)}} for i in range(2)]
+        go_parsers = [parsers.Parser(go=True, runtime_options=o) for o in options]
+
+        def string(media_type, content):
+            configured = go_config.options
+            sleep(0.001)
+
+            return go_config.options is configured and (
+                configured["html-keep-comments"] == (content == "keep")
+            )
+
+        minify_go.string.side_effect = string
+
+        def work(i):
+            return go_parsers[i % 2].minify("keep" if i % 2 else "drop", "html")
+
+        with ThreadPoolExecutor(8) as executor:
+            assert all(executor.map(work, range(200)))
+
+
+class TestMinifyTemplates:
+    def setup(self):
+        self.parser = parsers.Parser(go=False)
+        self.parser.update_runtime_options(html=True, js=True)
+        self.environment = Environment(extensions=[MinifyTemplates])
+        self.environment.minify_parser = self.parser
+
+    def test_minify_keeping_template_syntax(self):
+        minified = self.environment.preprocess(HTML_TEMPLATE, "index.html")
+
+        assert minified == MINIFIED_HTML_TEMPLATE
+
+    def test_minify_with_custom_delimiters(self):
+        self.environment.variable_start_string = "[["
+        self.environment.variable_end_string = "]]"
+        source = "<p>\n  [[ '  a  ' ]]  </p>"
+
+        assert self.environment.preprocess(source, "index.html") == (
+            "<p> [[ '  a  ' ]] </p>"
+        )
+
+    def test_not_minifying_non_html_templates(self):
+        assert self.environment.preprocess(HTML_TEMPLATE, "index.txt") == HTML_TEMPLATE
+        assert self.environment.preprocess(HTML_TEMPLATE, None) == HTML_TEMPLATE
+
+    def test_reporting_minified_templates_output(self):
+        self.environment.loader = DictLoader({"index.html": "<p>{{ a }}</p>"})
+        self.environment.minify_rendered = mock.Mock()
+        rendered = self.environment.get_template("index.html").render(a=1)
+        self.environment.from_string("<p>{{ a }}</p>").render(a=2)
+
+        self.environment.minify_rendered.assert_called_once_with(rendered)
+
+    def test_not_minifying_with_line_statements(self):
+        self.environment.line_statement_prefix = "#"
+
+        assert self.environment.preprocess(HTML_TEMPLATE, "index.html") == (
+            HTML_TEMPLATE
+        )
+
 
 class TestMemoryCache:
     def setup(self):
@@ -165,6 +561,38 @@ class TestMemoryCache:
             self.limit,
         )
 
+    def test_concurrent_misses_computed_once(self):
+        cache = self.get_cache()
+        barrier = Barrier(8)
+        getter = mock.Mock(side_effect=lambda: sleep(0.1) or self.to_cache)
+
+        def get_or_set():
+            barrier.wait()
+            return cache.get_or_set(self.content, getter)
+
+        with ThreadPoolExecutor(8) as executor:
+            values = list(executor.map(lambda _: get_or_set(), range(8)))
+
+        assert values == [self.to_cache] * 8
+        assert getter.call_count == 1
+
+    def test_concurrent_misses_share_exception(self):
+        cache = self.get_cache()
+        barrier = Barrier(4)
+        getter = mock.Mock(side_effect=lambda: sleep(0.1) or 1 / 0)
+
+        def get_or_set():
+            barrier.wait()
+            return cache.get_or_set(self.content, getter)
+
+        with ThreadPoolExecutor(4) as executor:
+            jobs = [executor.submit(get_or_set) for _ in range(4)]
+
+        for job in jobs:
+            assert isinstance(job.exception(), ZeroDivisionError)
+        assert getter.call_count == 1
+        assert cache.get_or_set(self.content, lambda: self.to_cache) == self.to_cache
+
     def test_caching_is_fixed_size(self):
         cache = self.get_cache()
         getter = lambda: self.to_cache
@@ -202,3 +630,767 @@ class TestMemoryCache:
 
         assert len(minified) == scope
         assert cache.store == {}
+
+    def test_lru_evicts_least_recently_used(self):
+        self.limit = 2
+        cache = self.get_cache()
+        cache.get_or_set("first", lambda: "1")
+        cache.get_or_set("second", lambda: "2")
+        cache.get_or_set("first", lambda: "1")
+        cache.get_or_set("third", lambda: "3")
+
+        assert set(cache.store.values()) == {"1", "3"}
+        assert cache.stats["evictions"] == 1
+
+    def test_lfu_evicts_least_frequently_used(self):
+        self.limit = 2
+        cache = MemoryCache(self.store_key_getter, self.limit, policy="lfu")
+
+        for _ in range(3):
+            cache.get_or_set("first", lambda: "1")
+
+        cache.get_or_set("second", lambda: "2")
+        cache.get_or_set("third", lambda: "3")
+        cache.get_or_set("fourth", lambda: "4")
+
+        assert set(cache.store.values()) == {"1", "4"}
+        assert cache.stats["evictions"] == 2
+
+    def test_unknown_caching_policy(self):
+        with pytest.raises(FlaskMinifyException):
+            MemoryCache(self.store_key_getter, self.limit, policy="fifo")
+
+    def test_caching_size_limit(self):
+        self.limit = 100
+        entry_size = get_size("x" * 16, self.to_cache)
+        cache = MemoryCache(self.store_key_getter, self.limit, entry_size * 3)
+
+        for i in range(10):
+            cache.get_or_set(f"{self.content}{i}", lambda: self.to_cache)
+
+        assert len(cache.store) == 3
+        assert cache.store.size <= entry_size * 3
+        assert cache.stats["evictions"] == 7
+
+    def test_caching_skips_entries_bigger_than_size_limit(self):
+        cache = MemoryCache(self.store_key_getter, self.limit, 10)
+
+        assert cache.get_or_set(self.content, lambda: self.to_cache) == self.to_cache
+        assert len(cache.store) == 0
+
+    def test_delete_entry(self):
+        cache = self.get_cache()
+        cache.get_or_set(self.content, lambda: self.to_cache)
+        del cache[cache.hash_key(self.content)]
+
+        assert len(cache.store) == 0
+        assert cache.size == 0
+
+    def test_caching_stats(self):
+        cache = self.get_cache()
+
+        for _ in range(3):
+            cache.get_or_set(self.content, lambda: self.to_cache)
+
+        assert cache.stats == {
+            "hits": 2,
+            "misses": 1,
+            "evictions": 0,
+            "stores": 1,
+            "entries": 1,
+            "size": cache.store.size,
+        }
+
+    def test_caching_store_limit(self):
+        cache = MemoryCache(lambda: self.store_key, self.limit, store_limit=3)
+
+        for i in range(10):
+            self.store_key = f"/static/{i}.js"
+            cache.get_or_set(self.content, lambda: self.to_cache)
+
+        assert list(cache._cache) == [f"/static/{i}.js" for i in range(7, 10)]
+        assert cache.stats["evictions"] == 7
+
+    def test_caching_store_limit_evicts_least_recently_used_store(self):
+        cache = MemoryCache(lambda: self.store_key, self.limit, store_limit=2)
+
+        for store_key in ("first", "second", "first", "third"):
+            self.store_key = store_key
+            cache.get_or_set(self.content, lambda: self.to_cache)
+
+        assert list(cache._cache) == ["first", "third"]
+
+    def test_caching_store_ttl(self):
+        cache = MemoryCache(lambda: self.store_key, self.limit, store_ttl=60)
+
+        with mock.patch("flask_minify.cache.monotonic", return_value=0):
+            self.store_key = "idle"
+            cache.get_or_set(self.content, lambda: self.to_cache)
+
+        with mock.patch("flask_minify.cache.monotonic", return_value=61):
+            self.store_key = "active"
+            cache.get_or_set(self.content, lambda: self.to_cache)
+
+        assert list(cache._cache) == ["active"]
+        assert cache.size == cache._cache["active"].size
+
+    def test_caching_memory_limit(self):
+        entry_size = get_size("x" * 16, self.to_cache)
+        cache = MemoryCache(
+            lambda: self.store_key,
+            self.limit,
+            memory_limit=entry_size * 3,
+        )
+
+        for i in range(10):
+            self.store_key = f"/static/{i}.js"
+            cache.get_or_set(self.content, lambda: self.to_cache)
+
+        assert len(cache._cache) == 3
+        assert cache.size == sum(s.size for s in cache._cache.values())
+        assert cache.size <= entry_size * 3
+
+
+def stress_memory_cache(cache, store_keys, threads=64, operations=200):
+    """Hammer the cache from many threads, with every kind of operation."""
+    barrier = Barrier(threads)
+    thread_store_key = local()
+    cache.store_key_getter = lambda: thread_store_key.value
+
+    def stress(worker):
+        barrier.wait()
+
+        for i in range(operations):
+            thread_store_key.value = store_keys[(worker + i) % len(store_keys)]
+            key = f"{worker % 8}-{i % 16}"
+
+            if i % 97 == 0:
+                cache.clear()
+            elif i % 31 == 0:
+                del cache[cache.hash_key(key)]
+            else:
+                assert cache.get_or_set(key, lambda: key * 8) == key * 8
+
+        return operations - operations // 97 - operations // 31 - 1
+
+    with ThreadPoolExecutor(threads) as executor:
+        return sum(executor.map(stress, range(threads)))
+
+
+@pytest.mark.parametrize("policy", ["lru", "lfu"])
+class TestMemoryCacheConcurrency:
+    def test_stress_limits(self, policy):
+        cache = MemoryCache(limit=4, policy=policy, store_limit=3)
+        lookups = stress_memory_cache(cache, [f"/{i}" for i in range(5)])
+        stats = cache.stats
+
+        assert stats["hits"] + stats["misses"] == lookups
+        assert stats["stores"] <= 3
+        assert all(len(store) <= 4 for store in cache._cache.values())
+        assert cache.size == sum(store.size for store in cache._cache.values())
+
+    def test_stress_memory_limit(self, policy):
+        memory_limit = get_size("0-0", "0-0" * 8) * 10
+        cache = MemoryCache(
+            limit=100, policy=policy, memory_limit=memory_limit, store_ttl=60
+        )
+        stress_memory_cache(cache, [f"/{i}" for i in range(5)])
+
+        assert cache.size <= memory_limit
+        assert cache.size == sum(store.size for store in cache._cache.values())
+        assert set(cache._accessed) == set(cache._cache)
+
+    def test_lookups_skip_recency_while_writing(self, policy):
+        cache = MemoryCache(limit=2, policy=policy)
+        cache["first"] = "minified"
+        cache["second"] = "minified"
+
+        with cache._lock:
+            assert cache["first"] == "minified"
+
+        cache["third"] = "minified"
+
+        assert "first" not in cache.store
+
+    def test_counters_released_with_threads(self, policy):
+        cache = MemoryCache(limit=2, policy=policy)
+
+        for _ in range(100):
+            thread = Thread(target=cache.get_or_set, args=("key", lambda: "value"))
+            thread.start()
+            thread.join()
+
+        assert (cache.hits, cache.misses) == (99, 1)
+        assert len(cache._hits._cells) == len(cache._misses._cells) == 0
+
+
+class PlantedEntry:
+    """Cache entry running code if it's ever unpickled."""
+
+    def __reduce__(self):
+        return (exec, ("raise AssertionError('unpickled')",))
+
+
+class FakeRedis:
+    """In-process stand-in for the subset of `redis.Redis` used by the cache."""
+
+    def __init__(self):
+        self.data = {}
+        self.expiries = {}
+
+    def get(self, name):
+        return self.data.get(name)
+
+    def set(self, name, value, ex=None, px=None, nx=False):
+        if nx and name in self.data:
+            return None
+
+        self.data[name] = value
+        self.expiries[name] = ex or px
+
+        return True
+
+    def exists(self, *names):
+        return sum(name in self.data for name in names)
+
+    def eval(self, script, numkeys, name, token):
+        # the compare-and-delete script releasing the cache locks
+        if self.data.get(name) != token:
+            return 0
+
+        self.delete(name)
+
+        return 1
+
+    def scan_iter(self, match="*"):
+        return (k for k in list(self.data) if fnmatch(k, match))
+
+    def delete(self, *names):
+        for name in names:
+            self.data.pop(name, None)
+
+
+class TestRedisCache:
+    def setup(self):
+        self.client = FakeRedis()
+        self.content = "test something to cache with"
+        self.to_cache = "testingsomethintocachehopefully"
+
+    def test_lock_shared_between_instances(self):
+        cache = RedisCache(client=self.client)
+        other_cache = RedisCache(client=self.client)
+        key = cache.hash_key(self.content)
+
+        assert cache.acquire(key) is True
+        assert other_cache.acquire(key) is False
+        assert other_cache.is_locked(key) is True
+        assert self.client.expiries["flask_minify:lock:" + key] == 5000
+
+        cache.release(key)
+
+        assert other_cache.is_locked(key) is False
+
+    def test_expired_lock_taken_again_not_released(self):
+        cache = RedisCache(client=self.client)
+        other_cache = RedisCache(client=self.client)
+        key = cache.hash_key(self.content)
+        cache.acquire(key)
+        self.client.delete("flask_minify:lock:" + key)  # expired
+
+        assert other_cache.acquire(key) is True
+
+        cache.release(key)
+
+        assert cache.is_locked(key) is True
+
+        other_cache.release(key)
+
+        assert cache.is_locked(key) is False
+
+    def test_get_or_set_waits_for_locking_instance(self):
+        cache = RedisCache(client=self.client)
+        key = cache.hash_key(self.content)
+        cache.acquire(key)
+        getter = mock.Mock(return_value="computed again")
+
+        def set_computed():
+            sleep(0.1)
+            cache[key] = self.to_cache
+            cache.release(key)
+
+        Thread(target=set_computed).start()
+
+        assert RedisCache(client=self.client).get_or_set(self.content, getter) == (
+            self.to_cache
+        )
+        assert getter.call_count == 0
+
+    def test_get_or_set_shared_between_instances(self):
+        worker_cache = RedisCache(self.client)
+        another_worker_cache = RedisCache(self.client)
+        getter = mock.Mock(return_value=self.to_cache)
+
+        assert worker_cache.get_or_set(self.content, getter) == self.to_cache
+        assert another_worker_cache.get_or_set(self.content, getter) == self.to_cache
+        assert getter.call_count == 1
+
+    def test_timeout_and_prefix(self):
+        cache = RedisCache(self.client, prefix="testing:", timeout=60)
+        cache.get_or_set(self.content, lambda: self.to_cache)
+        key = f"testing:{cache.hash_key(self.content)}"
+
+        assert list(self.client.data) == [key]
+        assert self.client.expiries[key] == 60
+
+    def test_delete_entry(self):
+        cache = RedisCache(self.client)
+        cache.get_or_set(self.content, lambda: self.to_cache)
+        del cache[cache.hash_key(self.content)]
+
+        assert self.client.data == {}
+
+    def test_minified_content_variants_restored(self):
+        cache = RedisCache(self.client)
+        minified = MinifiedContent(self.to_cache)
+        minified.encodings = {"gzip": b"compressed"}
+        cache.get_or_set(self.content, lambda: minified)
+        restored = RedisCache(self.client).get_or_set(self.content, lambda: "")
+
+        assert restored == self.to_cache
+        assert restored.encodings == {"gzip": b"compressed"}
+
+    def test_planted_pickled_entry_not_unpickled(self):
+        cache = RedisCache(self.client)
+        key = cache.hash_key(self.content)
+        self.client.set("flask_minify:" + key, pickle.dumps(PlantedEntry()))
+
+        assert cache.get_or_set(self.content, lambda: self.to_cache) == self.to_cache
+        assert cache.get_or_set(self.content, lambda: "") == self.to_cache
+
+    def test_clear_only_prefixed_keys(self):
+        cache = RedisCache(self.client)
+        self.client.set("unrelated", b"value")
+        cache.get_or_set(self.content, lambda: self.to_cache)
+        cache.clear()
+
+        assert list(self.client.data) == ["unrelated"]
+
+    def test_missing_redis_dependency(self):
+        with mock.patch("flask_minify.cache.redis", None):
+            with pytest.raises(FlaskMinifyException):
+                RedisCache()
+
+    def test_minify_with_cache_backend(self):
+        cache = RedisCache(self.client)
+        ext = minify(mock.Mock(), cache_backend=cache)
+
+        assert ext.cache is cache
+        assert cache.store_key_getter == ext.get_endpoint
+
+    def test_decorator_with_cache_backend(self):
+        cache = RedisCache(self.client)
+        view = decorator(html=True, cache_backend=cache, go=False)(lambda: HTML)
+
+        assert view() == MINIFIED_HTML.decode("utf-8")
+        assert [k.startswith("flask_minify:") for k in self.client.data] == [True]
+
+    def test_instances_with_different_options_sharing_backend(self):
+        cache = RedisCache(self.client)
+        content = lambda: HTML_EMBEDDED_TAGS
+        html_view = decorator(html=True, cache_backend=cache, go=False)(content)
+        js_view = decorator(html=True, js=True, cache_backend=cache, go=False)(content)
+        expected = parsers.Parser(go=False)
+        expected.update_runtime_options(html=True, js=True)
+
+        assert html_view() != js_view()
+        assert js_view() == expected.minify(HTML_EMBEDDED_TAGS, "html")
+
+
+def fill_disk_cache(path, worker):
+    cache = DiskCache(path)
+
+    for i in range(20):
+        cache.get_or_set(f"{worker}-{i}", lambda: f"minified-{i}")
+
+    return cache.get_or_set("shared", lambda: "minified")
+
+
+class TestDiskCache:
+    def setup(self):
+        self.directory = TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.sqlite")
+        self.content = "test something to cache with"
+        self.to_cache = "testingsomethintocachehopefully"
+
+    def teardown(self):
+        self.directory.cleanup()
+
+    def test_lock_shared_between_instances(self):
+        cache = DiskCache(self.path)
+        other_cache = DiskCache(self.path)
+        key = cache.hash_key(self.content)
+
+        assert cache.acquire(key) is True
+        assert other_cache.acquire(key) is False
+        assert other_cache.is_locked(key) is True
+
+        cache.release(key)
+
+        assert other_cache.acquire(key) is True
+
+    def test_expired_lock_computed_again(self):
+        cache = DiskCache(self.path)
+        other_cache = DiskCache(self.path)
+        cache.lock_timeout = other_cache.lock_timeout = 0.1
+        cache.acquire(cache.hash_key(self.content))
+
+        assert other_cache.get_or_set(self.content, lambda: self.to_cache) == (
+            self.to_cache
+        )
+        assert other_cache.is_locked(cache.hash_key(self.content)) is False
+
+    def test_expired_lock_taken_again_not_released(self):
+        cache = DiskCache(self.path)
+        other_cache = DiskCache(self.path)
+        key = cache.hash_key(self.content)
+        cache.lock_timeout = 0.01
+        cache.acquire(key)
+        sleep(0.02)
+
+        assert other_cache.acquire(key) is True
+
+        cache.release(key)
+
+        assert cache.is_locked(key) is True
+
+    def test_schema_created_once_per_process(self):
+        cache = DiskCache(self.path)
+        cache[cache.hash_key(self.content)] = self.to_cache
+        values = []
+
+        def lookup():
+            values.append(cache[cache.hash_key(self.content)])
+
+        with mock.patch.object(cache, "create_schema") as create_schema:
+            thread = Thread(target=lookup)
+            thread.start()
+            thread.join()
+
+        assert values == [self.to_cache]
+        assert create_schema.call_count == 0
+
+    def test_locked_database_is_a_miss(self):
+        cache = DiskCache(self.path, timeout=0.01)
+        key = cache.hash_key(self.content)
+        other_connection = sqlite3.connect(self.path, isolation_level=None)
+        other_connection.execute("BEGIN EXCLUSIVE")
+
+        try:
+            value = cache.get_or_set(self.content, lambda: self.to_cache)
+        finally:
+            other_connection.execute("ROLLBACK")
+            other_connection.close()
+
+        with mock.patch.object(
+            DiskCache, "connection", new_callable=mock.PropertyMock
+        ) as connection:
+            connection.return_value.execute.side_effect = sqlite3.OperationalError
+            locked_value = cache[key]
+            locked = cache.is_locked(key)
+
+        assert value == self.to_cache
+        assert (locked_value, locked) == (None, False)
+        assert cache[key] is None
+
+    def test_cache_survives_restarts(self):
+        getter = mock.Mock(return_value=self.to_cache)
+        DiskCache(self.path).get_or_set(self.content, getter)
+        restarted_cache = DiskCache(self.path)
+
+        assert restarted_cache.get_or_set(self.content, getter) == self.to_cache
+        assert getter.call_count == 1
+
+    def test_minified_content_variants_restored(self):
+        minified = MinifiedContent(self.to_cache)
+        minified.encodings = {"gzip": b"compressed"}
+        minified.etag = "digest"
+        DiskCache(self.path).get_or_set(self.content, lambda: minified)
+        restored = DiskCache(self.path).get_or_set(self.content, lambda: "")
+
+        assert restored == self.to_cache
+        assert restored.encodings == {"gzip": b"compressed"}
+        assert restored.etag == "digest"
+
+    def test_planted_pickled_entry_not_unpickled(self):
+        cache = DiskCache(self.path)
+        key = cache.hash_key(self.content)
+        data = pickle.dumps(PlantedEntry())
+        cache.connection.execute(
+            "INSERT INTO entries VALUES (?, ?, ?, ?)", (key, data, len(data), 0)
+        )
+
+        assert cache.get_or_set(self.content, lambda: self.to_cache) == self.to_cache
+
+    def test_size_limit_evicts_least_recently_used(self):
+        cache = DiskCache(self.path, size_limit=1024)
+        cache.touch_interval = 0
+        value = "x" * 300
+
+        for i in range(3):
+            cache.get_or_set(f"{self.content}{i}", lambda: value)
+
+        cache.get_or_set(f"{self.content}0", lambda: "")
+        cache.get_or_set(f"{self.content}3", lambda: value)
+
+        assert cache.size <= 1024
+        assert cache[cache.hash_key(f"{self.content}0")] == value
+        assert cache[cache.hash_key(f"{self.content}1")] is None
+
+    def test_delete_entry(self):
+        cache = DiskCache(self.path)
+        cache.get_or_set(self.content, lambda: self.to_cache)
+        del cache[cache.hash_key(self.content)]
+
+        assert cache[cache.hash_key(self.content)] is None
+        assert cache.size == 0
+
+    def test_clear(self):
+        cache = DiskCache(self.path)
+        cache.get_or_set(self.content, lambda: self.to_cache)
+        cache.clear()
+
+        assert cache[cache.hash_key(self.content)] is None
+        assert cache.size == 0
+
+    @pytest.mark.skipif(os.name != "posix", reason="Ownership requires getuid")
+    def test_default_path_private_to_user(self):
+        cache = DiskCache()
+        directory = os.path.dirname(cache.path)
+
+        assert os.path.basename(directory) == f"flask_minify-{os.getuid()}"
+        assert os.stat(directory).st_mode & 0o077 == 0
+
+    @pytest.mark.skipif(os.name != "posix", reason="Ownership requires getuid")
+    def test_file_owned_by_another_user_not_loaded(self):
+        DiskCache(self.path).get_or_set(self.content, lambda: self.to_cache)
+
+        cache = DiskCache(self.path)
+
+        with mock.patch("os.getuid", return_value=os.getuid() + 1):
+            with pytest.raises(FlaskMinifyException):
+                cache[cache.hash_key(self.content)]
+
+    def test_concurrent_processes(self):
+        with Pool(4) as pool:
+            results = pool.starmap(fill_disk_cache, [(self.path, w) for w in range(4)])
+
+        cache = DiskCache(self.path)
+        entries = cache.connection.execute("SELECT COUNT(*) FROM entries").fetchone()
+
+        assert results == ["minified"] * 4
+        assert entries == (81,)
+
+
+def fill_shared_memory_cache(name, worker):
+    cache = SharedMemoryCache(name)
+
+    for i in range(20):
+        cache.get_or_set(f"{worker}-{i}", lambda: f"minified-{i}")
+
+    return cache.get_or_set("shared", lambda: "minified")
+
+
+def acquire_shared_memory_lock(name, key):
+    cache = SharedMemoryCache(name)
+
+    try:
+        return cache.acquire(key)
+    finally:
+        cache.close()
+
+
+class TestSharedMemoryCache:
+    def setup(self):
+        self.name = f"flask_minify_{uuid4().hex[:8]}"
+        self.content = "test something to cache with"
+        self.to_cache = "testingsomethintocachehopefully"
+        self.caches = []
+
+    def teardown(self):
+        for cache in self.caches:
+            cache.close()
+
+        self.caches and self.caches[0].unlink()
+
+    def get_cache(self, **kwargs):
+        cache = SharedMemoryCache(self.name, **kwargs)
+        self.caches.append(cache)
+
+        return cache
+
+    @pytest.mark.skipif(os.name != "posix", reason="Ownership requires getuid")
+    def test_block_owned_by_another_user_not_attached(self):
+        self.get_cache()
+
+        with mock.patch("os.getuid", return_value=os.getuid() + 1):
+            with pytest.raises(FlaskMinifyException):
+                SharedMemoryCache(self.name)
+
+    @pytest.mark.skipif(os.name != "posix", reason="Locks require fcntl")
+    def test_lock_files_private_to_user(self):
+        cache = self.get_cache()
+
+        assert os.path.dirname(cache.lock_path) == get_private_dir()
+        assert os.path.dirname(cache.keys_lock_path) == get_private_dir()
+
+    @pytest.mark.skipif(os.name != "posix", reason="Locks require fcntl")
+    def test_lock_shared_between_processes(self):
+        cache = self.get_cache()
+        key = cache.hash_key(self.content)
+
+        with Pool(1) as pool:
+            assert cache.acquire(key) is True
+            assert pool.apply(acquire_shared_memory_lock, (self.name, key)) is False
+
+            cache.release(key)
+
+            assert pool.apply(acquire_shared_memory_lock, (self.name, key)) is True
+
+    def test_get_or_set_shared_between_instances(self):
+        getter = mock.Mock(return_value=self.to_cache)
+        self.get_cache().get_or_set(self.content, getter)
+
+        assert self.get_cache().get_or_set(self.content, getter) == self.to_cache
+        assert getter.call_count == 1
+
+    def test_minified_content_variants_restored(self):
+        cache = self.get_cache()
+        minified = MinifiedContent(self.to_cache)
+        minified.encodings = {"gzip": b"gzipped", "br": b"compressed"}
+        minified.etag = "digest"
+        cache[cache.hash_key(self.content)] = minified
+        restored = cache[cache.hash_key(self.content)]
+
+        assert restored == self.to_cache
+        assert restored.encodings == minified.encodings
+        assert restored.etag == "digest"
+
+    def test_lookups_not_locked(self):
+        cache = self.get_cache()
+        cache.get_or_set(self.content, lambda: self.to_cache)
+
+        with mock.patch.object(cache, "locked") as locked:
+            assert cache[cache.hash_key(self.content)] == self.to_cache
+
+        assert locked.call_count == 0
+
+    def test_overwritten_data_is_a_miss(self):
+        cache = self.get_cache()
+        cache.get_or_set(self.content, lambda: self.to_cache)
+        start = cache.data_start
+        cache.memory.buf[start : start + 4] = b"\xff" * 4
+
+        assert cache[cache.hash_key(self.content)] is None
+
+    def test_attaching_uses_existing_layout(self):
+        self.get_cache(size=4096, slots=16)
+        cache = self.get_cache()
+
+        assert (cache.data_size, cache.slots) == (4096, 16)
+
+    def test_ring_buffer_overwrites_oldest_entries(self):
+        cache = self.get_cache(size=1024, slots=64)
+        value = "x" * 300
+
+        for i in range(4):
+            cache.get_or_set(f"{self.content}{i}", lambda: value)
+
+        assert cache[cache.hash_key(f"{self.content}0")] is None
+        assert cache[cache.hash_key(f"{self.content}2")] == value
+        assert cache[cache.hash_key(f"{self.content}3")] == value
+
+    def test_full_index_evicts_entries(self):
+        cache = self.get_cache(slots=4)
+        keys = [f"{self.content}{i}" for i in range(10)]
+
+        for key in keys:
+            cache.get_or_set(key, lambda: key)
+
+        assert 0 < sum(cache[cache.hash_key(k)] is not None for k in keys) <= 4
+        assert cache[cache.hash_key(keys[-1])] == keys[-1]
+
+    def test_skips_entries_bigger_than_the_arena(self):
+        cache = self.get_cache(size=64)
+
+        assert cache.get_or_set(self.content, lambda: "x" * 100) == "x" * 100
+        assert cache[cache.hash_key(self.content)] is None
+
+    def test_clear(self):
+        cache = self.get_cache()
+        cache.get_or_set(self.content, lambda: self.to_cache)
+        cache.clear()
+
+        assert cache[cache.hash_key(self.content)] is None
+
+    def test_concurrent_processes(self):
+        cache = self.get_cache()
+
+        with Pool(4) as pool:
+            results = pool.starmap(
+                fill_shared_memory_cache, [(self.name, w) for w in range(4)]
+            )
+
+        assert results == ["minified"] * 4
+        assert all(
+            cache[cache.hash_key(f"{w}-{i}")] == f"minified-{i}"
+            for w in range(4)
+            for i in range(20)
+        )
+
+
+class TestTieredCache:
+    def setup(self):
+        self.content = "test something to cache with"
+        self.to_cache = "testingsomethintocachehopefully"
+        self.shared = RedisCache(FakeRedis())
+
+    def test_shared_hit_promoted_to_local_cache(self):
+        self.shared.get_or_set(self.content, lambda: self.to_cache)
+        local = MemoryCache(limit=2)
+        cache = TieredCache(local, self.shared)
+        getter = mock.Mock(return_value=self.to_cache)
+
+        assert cache.get_or_set(self.content, getter) == self.to_cache
+        assert local[cache.hash_key(self.content)] == self.to_cache
+        assert getter.call_count == 0
+
+    def test_miss_written_to_all_tiers(self):
+        local = MemoryCache(limit=2)
+        cache = TieredCache(local, self.shared)
+        cache.get_or_set(self.content, lambda: self.to_cache)
+        key = cache.hash_key(self.content)
+
+        assert local[key] == self.shared[key] == self.to_cache
+
+    def test_clear_all_tiers(self):
+        local = MemoryCache(limit=2)
+        cache = TieredCache(local, self.shared)
+        cache.get_or_set(self.content, lambda: self.to_cache)
+        cache.clear()
+        key = cache.hash_key(self.content)
+
+        assert local[key] is self.shared[key] is None
+
+    def test_unbounded_memory_tier_rejected(self):
+        with pytest.raises(FlaskMinifyException):
+            TieredCache(MemoryCache(), self.shared)
+
+        TieredCache(MemoryCache(memory_limit=1024), self.shared)
+
+    def test_minify_with_list_of_cache_backends(self):
+        local = MemoryCache(limit=2)
+        ext = minify(mock.Mock(), cache_backend=[local, self.shared])
+
+        assert isinstance(ext.cache, TieredCache)
+        assert ext.cache.tiers == (local, self.shared)
+        assert local.store_key_getter == ext.get_endpoint